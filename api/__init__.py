@@ -1,13 +1,10 @@
-import os
-import logging
-from logging.handlers import SMTPHandler, RotatingFileHandler
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from config import Config
+from api.replica import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 cors = CORS()
 
@@ -15,10 +12,21 @@ cors = CORS()
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
     db.init_app(app)
     migrate.init_app(app, db)
     cors.init_app(app)
 
+    from api import cache, fastjson
+    cache.init_app(app)
+    fastjson.init_app(app)
+
+    from api.metrics import metrics
+    metrics.init_app(app)
+
     @app.route('/api/ping')
     def ping():
         return {"message": "Ping!"}
@@ -33,23 +41,19 @@ def create_app(config_class=Config):
 
     from api import models
 
-    if not app.debug and not app.testing:
-        if app.config['LOG_TO_STDOUT']:
-            stream_handler = logging.StreamHandler()
-            stream_handler.setLevel(logging.INFO)
-            app.logger.addHandler(stream_handler)
-        else:
-            if not os.path.exists('logs'):
-                os.mkdir('logs')
-            file_handler = RotatingFileHandler('logs/cmp.log',
-                                               maxBytes=10240, backupCount=10)
-            file_handler.setFormatter(logging.Formatter(
-                '%(asctime)s %(levelname)s: %(message)s '
-                '[in %(pathname)s:%(lineno)d]'))
-            file_handler.setLevel(logging.INFO)
-            app.logger.addHandler(file_handler)
-
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('Computing Masters Project startup')
+    from api.catalog import catalog
+    catalog.init_app(app)
+    from api.denylist import denylist
+    denylist.init_app(app)
+    from api.userchanges import user_changes
+    user_changes.init_app(app)
+
+    from api import logs
+    logs.init_app(app)
+    from api.profiling import profiler
+    profiler.init_app(app)
+    from api import ratelimit
+    ratelimit.init_app(app)
+    app.logger.info('Computing Masters Project startup')
 
     return app
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from flask import current_app
+
+
+class TTLCache(object):
+    """Thread-safe, bounded LRU cache whose entries expire.
+
+    :param maxsize: Entries kept before the least recently used is evicted
+    :param ttl: Default lifetime of an entry in seconds, None for no limit
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        """
+        Cache a value
+
+        :param expires_at: Unix time the entry expires at, defaults to now
+            plus the cache ttl
+        """
+        if expires_at is None and self.ttl is not None:
+            expires_at = time() + self.ttl
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def init_app(app):
+    app.config.setdefault('TOKEN_CACHE_SIZE', 4096)
+    app.config.setdefault('USER_CACHE_SIZE', 4096)
+    app.config.setdefault('USER_CACHE_TTL', 30)
+    app.config.setdefault('SENTENCE_CACHE_SIZE', 1024)
+    app.config.setdefault('SENTENCE_CACHE_TTL', 10 * 60)
+    app.extensions['token_cache'] = TTLCache(app.config['TOKEN_CACHE_SIZE'])
+    app.extensions['user_cache'] = TTLCache(
+        app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    app.extensions['sentence_cache'] = TTLCache(
+        app.config['SENTENCE_CACHE_SIZE'], app.config['SENTENCE_CACHE_TTL'])
+
+
+def token_cache():
+    """Verified token claims, keyed by token digest"""
+    return current_app.extensions['token_cache']
+
+
+def user_cache():
+    """User column values, keyed by user id"""
+    return current_app.extensions['user_cache']
+
+
+def sentence_cache():
+    """Sentence analyses, keyed by a hash of the sentences"""
+    return current_app.extensions['sentence_cache']
@@ -0,0 +1,123 @@
+import random
+from collections import namedtuple
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from api import db
+from api.models import CatalogVersion, Question
+
+Snapshot = namedtuple('Snapshot', ['version', 'ids', 'texts', 'checked_at'])
+
+
+class QuestionCatalog(object):
+    """Process-local, read-through cache of the questions table.
+
+    Every worker keeps an immutable snapshot of the question ids and texts so
+    a random question can be picked without hitting the database. The
+    snapshot is revalidated at most every ``QUESTION_CATALOG_TTL`` seconds
+    against the ``catalog_version`` row, which is bumped whenever a question
+    is inserted, updated or deleted through the ORM.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUESTION_CATALOG_CACHE', True)
+        app.config.setdefault('QUESTION_CATALOG_TTL', 5)
+        app.extensions['question_catalog'] = None
+
+    @staticmethod
+    def current_version():
+        """
+        Get the version of the questions table
+
+        :return int: The version, 0 if it was never bumped
+        """
+        version = db.session.query(CatalogVersion.version).filter(
+            CatalogVersion.name == CatalogVersion.QUESTIONS).scalar()
+        return version or 0
+
+    def _load(self, version):
+        rows = db.session.query(Question.id, Question.text).order_by(
+            Question.id).all()
+        return Snapshot(version,
+                        tuple(str(row.id) for row in rows),
+                        tuple(row.text for row in rows),
+                        monotonic())
+
+    def snapshot(self):
+        app = current_app._get_current_object()
+
+        if not app.config['QUESTION_CATALOG_CACHE']:
+            return self._load(None)
+
+        snapshot = app.extensions.get('question_catalog')
+        now = monotonic()
+
+        if snapshot is not None and \
+                now - snapshot.checked_at < app.config['QUESTION_CATALOG_TTL']:
+            return snapshot
+
+        version = self.current_version()
+        if snapshot is not None and snapshot.version == version:
+            snapshot = snapshot._replace(checked_at=now)
+        else:
+            snapshot = self._load(version)
+
+        # Swapping in a new tuple is atomic, concurrent readers either see
+        # the old snapshot or the new one.
+        app.extensions['question_catalog'] = snapshot
+        return snapshot
+
+    def all(self):
+        """
+        Get every question as a list of serialized questions
+
+        :return list: [{'id': ..., 'text': ...}]
+        """
+        snapshot = self.snapshot()
+        return [{'id': id, 'text': text}
+                for id, text in zip(snapshot.ids, snapshot.texts)]
+
+    def random(self, snapshot=None):
+        """
+        Pick a random question
+
+        :param snapshot: The snapshot to pick from, defaults to the current one
+        :raises IndexError: If there are no questions
+        :return dict: {'id': ..., 'text': ...}
+        """
+        snapshot = snapshot or self.snapshot()
+
+        if not snapshot.ids:
+            raise IndexError('Cannot choose from an empty question catalog')
+
+        index = random.randrange(len(snapshot.ids))
+        return {'id': snapshot.ids[index], 'text': snapshot.texts[index]}
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_catalog_version(session, flush_context):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+
+    if not any(isinstance(obj, Question) for obj in changed):
+        return
+
+    table = CatalogVersion.__table__
+    connection = session.connection()
+    result = connection.execute(
+        table.update()
+        .where(table.c.name == CatalogVersion.QUESTIONS)
+        .values(version=table.c.version + 1))
+
+    if result.rowcount == 0:
+        connection.execute(
+            table.insert().values(name=CatalogVersion.QUESTIONS, version=1))
+
+
+catalog = QuestionCatalog()
@@ -1,6 +1,8 @@
-from sqlalchemy import exc
-from api import db as _db
-from api.models import Question
+import click
+from flask import current_app
+
+# The modules behind the commands are imported when they run, so that
+# loading the app for one command doesn't import all of them.
 
 
 def register(app):
@@ -10,22 +12,142 @@ def register(app):
         pass
 
 
-    @seed.command()   
+    @seed.command()
     def questions_table():
         """Seeds the questions table."""
-        questions = [
-            "What was the happiest moment of your life",
-            "What was your first nickname"
-        ]
-        
-        q1 = Question()
-        q1.text = questions[0]
-        q2 = Question()
-        q2.text = questions[1]
-
-        try:
-            _db.session.add_all([q1, q2])
-            _db.session.commit()
-        except exc.IntegrityError as error:
-            _db.session.rollback()
-            print(f'Error: {error}')
+        from api.seed import seed_questions
+
+        print(f'Added {seed_questions()} questions')
+
+
+    @app.cli.group()
+    def reminders():
+        """Password reminder commands."""
+        pass
+
+
+    @reminders.command()
+    @click.option('--batch-size', type=int, help='Users claimed per batch.')
+    def send(batch_size):
+        """Queues every password reminder that is due."""
+        from api import reminders as _reminders
+
+        sent = _reminders.send_due_reminders(batch_size)
+        print(f'Queued {sent} password reminders')
+
+
+    @reminders.command()
+    @click.option('--interval', type=int, help='Seconds between runs.')
+    def run(interval):
+        """Runs the password reminder scheduler."""
+        from api import reminders as _reminders
+
+        _reminders.run(interval)
+
+
+    @app.cli.group()
+    def outbox():
+        """Email outbox commands."""
+        pass
+
+
+    @outbox.command('send')
+    def send_outbox():
+        """Sends every pending email that is due."""
+        from api import outbox as _outbox
+
+        sent, failed = _outbox.run(once=True)
+        print(f'Sent {sent} emails, {failed} failed')
+
+
+    @outbox.command('run')
+    @click.option('--interval', type=int, help='Seconds between runs.')
+    def run_outbox(interval):
+        """Runs the email outbox dispatcher."""
+        from api import outbox as _outbox
+
+        _outbox.run(interval)
+
+
+    @app.cli.group()
+    def passwords():
+        """Password hashing commands."""
+        pass
+
+
+    @passwords.command()
+    @click.option('--target-ms', type=int, default=250,
+                  help='Target milliseconds per hash.')
+    def calibrate(target_ms):
+        """Picks a work factor for a target hashing latency on this host."""
+        from api import hashing as _hashing
+
+        work_factor, elapsed = _hashing.calibrate(target_ms)
+        print(f'PASSWORD_HASH_WORK_FACTOR={work_factor} '
+              f'({elapsed:.1f}ms per hash)')
+
+
+    @app.cli.group()
+    def profile():
+        """Request profiling commands."""
+        pass
+
+
+    @profile.command()
+    @click.option('--minutes', type=int, default=10,
+                  help='Minutes the token is valid for.')
+    def token(minutes):
+        """Prints a header that gets requests profiled."""
+        from api import profiling as _profiling
+
+        print(f'{_profiling.HEADER}: {_profiling.make_token(minutes * 60)}')
+
+
+    @app.cli.group()
+    def users():
+        """User commands."""
+        pass
+
+
+    @users.command('import')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', type=click.Choice(['jsonl', 'csv']),
+                  help='Defaults to the file extension.')
+    @click.option('--batch-size', type=int, default=500,
+                  help='Users per transaction.')
+    @click.option('--workers', type=int, help='Password hashing processes.')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False),
+                  help='Defaults to PATH.checkpoint.')
+    @click.option('--email/--no-email', default=True,
+                  help='Queue the password email for every user.')
+    def import_users(path, format, batch_size, workers, checkpoint, email):
+        """Imports users from a JSONL or CSV file."""
+        from api import importer as _importer
+
+        imported, rejected = _importer.import_users(
+            path, format, batch_size, workers, checkpoint, email)
+        print(f'Done: imported {imported} users, rejected {rejected}')
+
+
+    @users.command('export')
+    @click.option('--table', 'tables', multiple=True,
+                  help='Tables to export: user, answer or sentence, '
+                       'defaults to all of them.')
+    @click.option('--output', type=click.File('w'), default='-',
+                  help='Defaults to stdout.')
+    @click.option('--page-size', type=int,
+                  help='Rows per query, defaults to EXPORT_PAGE_SIZE.')
+    def export_users(tables, output, page_size):
+        """Exports users, answers and sentences as NDJSON."""
+        from api import export as _export
+
+        unknown = [table for table in tables if table not in _export.TABLES]
+        if unknown:
+            raise click.BadParameter(
+                f"must be one of {', '.join(_export.TABLES)}",
+                param_hint='--table')
+
+        page_size = page_size or current_app.config['EXPORT_PAGE_SIZE']
+        for line in _export.iter_ndjson(tables or list(_export.TABLES),
+                                        page_size):
+            output.write(line)
@@ -0,0 +1,167 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from time import monotonic, time
+
+from flask import current_app
+
+from api import db
+from api.models import RevokedToken
+from api.replica import primary
+
+# Rows are re-read this far below the newest id seen, so a revocation whose
+# transaction commits after a later one is not skipped.
+OVERLAP = 100
+
+Snapshot = namedtuple('Snapshot', ['last_id', 'jtis', 'users', 'checked_at'])
+
+
+def unix_time(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TokenDenylist(object):
+    """Process-local snapshot of the revoked_token table.
+
+    ``jtis`` maps revoked token ids to their expiry and ``users`` maps user
+    ids to the time before which their tokens are revoked and its expiry,
+    all in Unix seconds. Checking a token is two dict lookups. Every
+    ``TOKEN_DENYLIST_REFRESH_SECONDS`` the snapshot fetches the rows added
+    since the last refresh, so a revocation made by another worker applies
+    here within that delay.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TOKEN_DENYLIST_REFRESH_SECONDS', 2)
+        app.extensions['token_denylist'] = None
+
+    def _refresh(self, snapshot, now):
+        query = db.session.query(
+            RevokedToken.id, RevokedToken.jti, RevokedToken.userId,
+            RevokedToken.issued_before, RevokedToken.expires_at)
+
+        if snapshot is None:
+            query = query.filter(RevokedToken.expires_at > datetime.utcnow())
+            snapshot = Snapshot(0, {}, {}, now)
+        else:
+            query = query.filter(RevokedToken.id > snapshot.last_id - OVERLAP)
+
+        # A replica could still miss a revocation the primary has.
+        with primary():
+            rows = query.order_by(RevokedToken.id).all()
+
+        new = [row for row in rows if row.id > snapshot.last_id or
+               (row.jti is not None and row.jti not in snapshot.jtis) or
+               (row.userId is not None and
+                snapshot.users.get(row.userId, (0, 0))[0] <
+                unix_time(row.issued_before))]
+        if not new:
+            return snapshot._replace(checked_at=now)
+
+        # Copy on write, dropping what has expired since the last copy.
+        unix_now = time()
+        jtis = {jti: expires for jti, expires in snapshot.jtis.items()
+                if expires > unix_now}
+        users = {id: revoked for id, revoked in snapshot.users.items()
+                 if revoked[1] > unix_now}
+
+        for row in new:
+            expires = unix_time(row.expires_at)
+            if row.jti is not None:
+                jtis[row.jti] = expires
+            if row.userId is not None:
+                before = unix_time(row.issued_before)
+                if before > users.get(row.userId, (0, 0))[0]:
+                    users[row.userId] = (before, expires)
+        return Snapshot(max(snapshot.last_id, rows[-1].id), jtis, users, now)
+
+    def snapshot(self):
+        app = current_app._get_current_object()
+        snapshot = app.extensions.get('token_denylist')
+        now = monotonic()
+
+        if snapshot is not None and now - snapshot.checked_at < \
+                app.config['TOKEN_DENYLIST_REFRESH_SECONDS']:
+            return snapshot
+
+        snapshot = self._refresh(snapshot, now)
+        app.extensions['token_denylist'] = snapshot
+        return snapshot
+
+    def is_revoked(self, payload):
+        """
+        Check a decoded token against the denylist
+
+        :param payload: The claims returned by ``User.decode_auth_token``
+        :return bool: Whether the token was revoked
+        """
+        snapshot = self.snapshot()
+
+        if payload.get('jti') in snapshot.jtis:
+            return True
+
+        revoked = snapshot.users.get(payload.get('id'))
+        return revoked is not None and payload.get('iat', 0) < revoked[0]
+
+    def _added(self):
+        # Make this worker see the new row on its next check.
+        snapshot = current_app.extensions.get('token_denylist')
+        if snapshot is not None:
+            current_app.extensions['token_denylist'] = \
+                snapshot._replace(checked_at=float('-inf'))
+
+    def revoke(self, payload):
+        """
+        Revoke one token. The row is added to the session, the caller
+        commits.
+
+        :param payload: The claims returned by ``User.decode_auth_token``
+        """
+        if payload.get('jti') is None:
+            # Tokens issued before jti existed can only be revoked with the
+            # rest of the user's tokens.
+            return self.revoke_user(payload['id'])
+
+        self.prune()
+        db.session.add(RevokedToken(
+            jti=payload['jti'],
+            expires_at=datetime.utcfromtimestamp(payload['exp'])))
+        self._added()
+
+    def revoke_user(self, user_id):
+        """
+        Revoke every token of a user issued before the current second, e.g.
+        after a password change. Tokens issued from now on stay valid. The
+        row is added to the session, the caller commits.
+
+        :param user_id: The user's id
+        """
+        config = current_app.config
+        lifetime = max(
+            timedelta(days=config['TOKEN_EXPIRATION_DAYS'],
+                      seconds=config['TOKEN_EXPIRATION_SECONDS']),
+            timedelta(seconds=config['PASSWORD_TOKEN_EXPIRATION_HRS']))
+        now = datetime.utcnow().replace(microsecond=0)
+
+        self.prune()
+        db.session.add(RevokedToken(userId=user_id, issued_before=now,
+                                    expires_at=now + lifetime))
+        self._added()
+
+    @staticmethod
+    def prune():
+        """
+        Delete the rows of expired tokens, they are cheap to find through
+        the expires_at index
+
+        :return int: Number of rows deleted
+        """
+        return RevokedToken.query.filter(
+            RevokedToken.expires_at <= datetime.utcnow()).delete(
+            synchronize_session=False)
+
+
+denylist = TokenDenylist()
@@ -1,26 +1,71 @@
 from urllib.parse import urlencode
-import requests
 from flask import current_app
 
+from api import db
+from api.models import OutboxEmail
 
-def send_password_email(user, reset=False, password=None):
+
+def password_email(user, reset=False, password=None):
+    """Render the password email
+
+    Args:
+        user (User): The recipient, it must have an id
+        reset (bool): Render the password reset email instead of the welcome one
+        password (str): The password to embed in the token
+
+    Returns:
+        dict: The recipient, subject and html of the email
+    """
     token = user.encode_auth_token(password=password, reset_password=reset)
     url = current_app.config['WEB_CLIENT_BASE_URL'] + \
         '/password?' + urlencode({'qs': token})
     html = get_password_reset_html(url, user.username) if reset \
         else get_new_user_html(url, user.username)
-    response = requests.post(
-        current_app.config['MAIL_SERVER'],
-        auth=("api", f"{current_app.config['MAIL_SERVER_API_KEY']}"),
-        data={"from": f"Computing Masters Project <mailgun@{current_app.config['DOMAIN_NAME']}.com>",
-              "to": [user.email],
-              "subject": "Password",
-              "html": html})
-
-    if not response.ok:
-        print(response.reason)
-        print(response.text)
-        raise requests.RequestException('An error has occurred')
+    return {'recipient': user.email, 'subject': 'Password', 'html': html}
+
+
+def queue_password_email(user, reset=False, password=None):
+    """Write the password email to the outbox.
+
+    The email is added to the current session but not committed, so it is
+    only sent if the caller's transaction commits. The outbox dispatcher
+    (``flask outbox run``) delivers it.
+
+    Args:
+        user (User): The recipient, it must have an id
+        reset (bool): Send the password reset email instead of the welcome one
+        password (str): The password to embed in the token
+
+    Returns:
+        OutboxEmail: The queued email
+    """
+    email = OutboxEmail(**password_email(user, reset, password))
+    db.session.add(email)
+    return email
+
+
+def deliver(session, config, email):
+    """Post an email to the mail server
+
+    Safe to call outside of the app context, e.g. from a worker thread.
+
+    Args:
+        session (requests.Session): The pooled HTTP session
+        config (dict): The app config
+        email (dict): The recipient, subject and html of an outbox email
+
+    Returns:
+        requests.Response: The mail server response
+    """
+    response = session.post(
+        config['MAIL_SERVER'],
+        auth=("api", f"{config['MAIL_SERVER_API_KEY']}"),
+        data={"from": f"Computing Masters Project <mailgun@{config['DOMAIN_NAME']}.com>",
+              "to": [email['recipient']],
+              "subject": email['subject'],
+              "html": email['html']},
+        timeout=config['MAIL_TIMEOUT_SECONDS'])
+    response.raise_for_status()
     return response
 
 
@@ -1,3 +1,5 @@
+from math import ceil
+
 from flask import jsonify, Blueprint
 from werkzeug.http import HTTP_STATUS_CODES
 
@@ -29,6 +31,26 @@ def server_error(message):
     return error_response(500, message)
 
 
+class TooManyRequests(Exception):
+    """Raised to shed a request, it is answered with a 429"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def too_many_requests(message, retry_after):
+    response = error_response(429, message)
+    response.headers['Retry-After'] = str(max(1, ceil(retry_after)))
+    return response
+
+
+@errors.app_errorhandler(TooManyRequests)
+def too_many_requests_error(error):
+    return too_many_requests(error.message, error.retry_after)
+
+
 @errors.app_errorhandler(404)
 def not_found_error(error):
     return not_found('Not found.')
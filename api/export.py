@@ -0,0 +1,72 @@
+import json
+from datetime import date
+
+from sqlalchemy import select
+
+from api import db
+from api.models import Answer, Sentence, User
+
+# The columns exported from each table, password hashes are left out.
+TABLES = {
+    'user': [column for column in User.__table__.columns
+             if column.key != 'password'],
+    'answer': list(Answer.__table__.columns),
+    'sentence': list(Sentence.__table__.columns),
+}
+
+
+def iter_rows(name, page_size=1000):
+    """Stream the rows of an exported table in id order
+
+    Rows are read in keyset-paginated pages (``WHERE id > last id``) through
+    a server-side cursor where the database supports one, so memory use and
+    the length of each query stay constant however big the table is.
+
+    Args:
+        name (str): 'user', 'answer' or 'sentence'
+        page_size (int): Rows per query
+
+    Yields:
+        dict: A row
+    """
+    columns = TABLES[name]
+    id = columns[0].table.c.id
+    last_id = None
+
+    while True:
+        query = select(*columns).order_by(id).limit(page_size)
+        if last_id is not None:
+            query = query.where(id > last_id)
+
+        result = db.session.connection().execution_options(
+            stream_results=True).execute(query)
+        count = 0
+        for row in result:
+            count += 1
+            last_id = row.id
+            yield dict(row._mapping)
+
+        # Don't hold a transaction open across pages.
+        db.session.commit()
+        if count < page_size:
+            return
+
+
+def to_json(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def iter_ndjson(names, page_size=1000):
+    """Stream the tables as newline-delimited JSON
+
+    Every line is a row with a ``table`` key naming its table.
+
+    Yields:
+        str: A line
+    """
+    for name in names:
+        for row in iter_rows(name, page_size):
+            row['table'] = name
+            yield json.dumps(row, default=to_json) + '\n'
@@ -0,0 +1,67 @@
+import json
+from datetime import date
+
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """Flask's encoder, but dates are ISO 8601 strings like orjson's"""
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+class ORJSONEncoder(JSONEncoder):
+    """Encodes with orjson, falling back to ``default`` for the types it
+    does not know. Non-ASCII characters are written as UTF-8 rather than
+    escaped, whatever JSON_AS_ASCII says.
+    """
+
+    def encode(self, o):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(o, default=self.default, option=option).decode()
+
+
+class ORJSONDecoder(json.JSONDecoder):
+    def __init__(self, **kwargs):
+        # json.loads makes a decoder per call, skip building the scanner.
+        pass
+
+    def decode(self, s):
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so Flask
+        # still answers malformed bodies with a 400.
+        return orjson.loads(s)
+
+
+PROVIDERS = {
+    'orjson': (ORJSONEncoder, ORJSONDecoder),
+    'stdlib': (JSONEncoder, json.JSONDecoder),
+}
+
+
+def init_app(app):
+    """Serialize responses and parse request bodies with JSON_PROVIDER
+
+    'orjson' (the default) falls back to 'stdlib' when orjson is not
+    installed.
+    """
+    app.config.setdefault('JSON_PROVIDER', 'orjson')
+    name = app.config['JSON_PROVIDER']
+
+    if name not in PROVIDERS:
+        raise ValueError(f"JSON_PROVIDER must be one of {', '.join(PROVIDERS)}")
+    if name == 'orjson' and orjson is None:
+        name = 'stdlib'
+
+    app.json_encoder, app.json_decoder = PROVIDERS[name]
@@ -0,0 +1,196 @@
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from secrets import token_hex
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from api.errors import TooManyRequests
+
+_executor = None
+_executor_pid = None
+_executor_lock = Lock()
+_slots = None
+
+
+
+def executor():
+    """Get this process' hashing pool, None if hashing runs inline.
+
+    The pool is created lazily, and again after a fork, so each gunicorn
+    worker gets its own.
+    """
+    global _executor, _executor_pid
+
+    workers = current_app.config['PASSWORD_HASH_WORKERS']
+    if not workers:
+        return None
+
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def slots():
+    """Get this process' semaphore bounding concurrent hashes, None if
+    PASSWORD_HASH_CONCURRENCY is 0"""
+    global _slots
+
+    limit = current_app.config['PASSWORD_HASH_CONCURRENCY']
+    if not limit:
+        return None
+
+    with _executor_lock:
+        if _slots is None or _slots[0] != limit:
+            _slots = (limit, BoundedSemaphore(limit))
+    return _slots[1]
+
+
+def run(func, *args):
+    """Run ``func`` in the hashing pool and wait for its result
+
+    :raises TooManyRequests: If PASSWORD_HASH_CONCURRENCY hashes are already
+        running in this process. Excess requests are shed rather than queued.
+    """
+    semaphore = slots()
+
+    if semaphore is not None and not semaphore.acquire(blocking=False):
+        raise TooManyRequests('The server is busy, please try again.')
+
+    try:
+        pool = executor()
+        if pool is None:
+            return func(*args)
+        return pool.submit(func, *args).result()
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+
+
+def _scrypt(password, salt, method):
+    n, r, p = (int(value) for value in method.split(':')[1:])
+    # Allow twice the 128 * r * n bytes the parameters need, and OpenSSL's
+    # default of 32MB, which small parameters need for their overhead.
+    return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r,
+                          p=p, maxmem=max(256 * r * n, 2 ** 25),
+                          dklen=64).hex()
+
+
+def scrypt_hash(password, method):
+    """Hash a password with hashlib.scrypt, in Werkzeug's format
+
+    Args:
+        password (str): The plain text password
+        method (str): 'scrypt:<n>:<r>:<p>'
+
+    Returns:
+        str: '<method>$<salt>$<hex digest>'
+    """
+    salt = token_hex(8)
+    return f'{method}${salt}${_scrypt(password, salt, method)}'
+
+
+def verify_password(password_hash, password):
+    """Check a password against a hash made by any of the HASHERS, so
+    hashes stay valid after PASSWORD_HASHER changes"""
+    if not password_hash.startswith('scrypt:'):
+        return check_password_hash(password_hash, password)
+
+    method, salt, digest = password_hash.split('$', 2)
+    return hmac.compare_digest(_scrypt(password, salt, method), digest)
+
+
+class PBKDF2Hasher(object):
+    """Werkzeug's PBKDF2 hashes, e.g. ``pbkdf2:sha256:260000$salt$hash``
+
+    :param algorithm: The digest, e.g. sha256
+    :param work_factor: Number of iterations
+    """
+    WORK_FACTOR = 260000
+    generate = staticmethod(generate_password_hash)
+
+    def __init__(self, algorithm='sha256', work_factor=WORK_FACTOR):
+        self.work_factor = work_factor
+        self.method = f'pbkdf2:{algorithm}:{work_factor}'
+
+    def hash(self, password):
+        return run(self.generate, password, self.method)
+
+    def verify(self, password_hash, password):
+        return run(verify_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+
+class ScryptHasher(PBKDF2Hasher):
+    """scrypt hashes, e.g. ``scrypt:32768:8:1$salt$hash``. Memory-hard: each
+    hash needs 128 * 8 * work_factor bytes, 32MB by default.
+
+    :param algorithm: Unused, scrypt has no digest to choose
+    :param work_factor: The CPU/memory cost N, rounded down to a power of 2
+    """
+    WORK_FACTOR = 2 ** 15
+    generate = staticmethod(scrypt_hash)
+
+    def __init__(self, algorithm=None, work_factor=WORK_FACTOR):
+        self.work_factor = 1 << max(1, work_factor.bit_length() - 1)
+        self.method = f'scrypt:{self.work_factor}:8:1'
+
+
+HASHERS = {
+    'pbkdf2': PBKDF2Hasher,
+    'scrypt': ScryptHasher,
+}
+
+
+def get_hasher(work_factor=None):
+    """Get the hasher the app is configured with
+
+    Args:
+        work_factor (int): Overrides PASSWORD_HASH_WORK_FACTOR
+
+    Returns:
+        PBKDF2Hasher: The password hasher, a ScryptHasher for scrypt
+    """
+    config = current_app.config
+    hasher = HASHERS[config['PASSWORD_HASHER']]
+    return hasher(config['PASSWORD_HASH_ALGORITHM'],
+                  work_factor or config['PASSWORD_HASH_WORK_FACTOR'] or
+                  hasher.WORK_FACTOR)
+
+
+def calibrate(target_ms, rounds=5):
+    """Find the work factor whose hash takes about ``target_ms`` on this host
+
+    Args:
+        target_ms (int): The target latency of one hash in milliseconds
+        rounds (int): Number of hashes timed per measurement
+
+    Returns:
+        tuple: The work factor and the measured milliseconds per hash
+    """
+    def measure(work_factor):
+        hasher = get_hasher(work_factor)
+        start = perf_counter()
+        for _ in range(rounds):
+            hasher.generate('calibration', hasher.method)
+        return hasher.work_factor, (perf_counter() - start) * 1000 / rounds
+
+    default = HASHERS[current_app.config['PASSWORD_HASHER']].WORK_FACTOR
+    work_factor, elapsed = measure(default // 16)
+
+    # Hashing time is linear in the work factor, refine the estimate once.
+    for _ in range(2):
+        work_factor, elapsed = measure(
+            max(default // 256, int(work_factor * target_ms / elapsed)))
+    return work_factor, elapsed
@@ -0,0 +1,249 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice, repeat
+from time import perf_counter
+
+from marshmallow import ValidationError
+from sqlalchemy import or_
+
+from api import db
+from api.email import password_email
+from api.hashing import get_hasher
+from api.models import Answer, OutboxEmail, Sentence, User
+from api.schema import UNIQUE_ERRORS, UserSchema
+
+
+class ImportUserSchema(UserSchema):
+    def validate_unique(self, data, **kwargs):
+        """Uniqueness is checked once per chunk by the importer"""
+
+
+import_user_schema = ImportUserSchema()
+
+# A row that could not be parsed, it is rejected with ``errors``.
+MalformedRow = namedtuple('MalformedRow', ['errors'])
+
+
+def read_rows(path, format=None):
+    """Stream the rows of a JSONL or CSV file
+
+    In CSV files the answers and sentences columns hold JSON arrays, in the
+    same shape as the POST /api/users body.
+
+    Args:
+        path (str): The file
+        format (str): 'jsonl' or 'csv', guessed from the extension if None
+
+    Yields:
+        tuple: The line number and the row, or a MalformedRow if the line
+            or one of its JSON cells can't be decoded
+    """
+    format = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+
+    with open(path, newline='') as file:
+        if format == 'csv':
+            for number, row in enumerate(csv.DictReader(file), start=1):
+                row = {key: value for key, value in row.items() if value != ''}
+                errors = {}
+                for key in ('answers', 'sentences'):
+                    if key in row:
+                        try:
+                            row[key] = json.loads(row[key])
+                        except ValueError as error:
+                            errors[key] = [f'Not valid JSON: {error}']
+                yield number, MalformedRow(errors) if errors else row
+        else:
+            for number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError as error:
+                        yield number, MalformedRow(
+                            {'_schema': [f'Not valid JSON: {error}']})
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        return int(file.read().strip() or 0)
+
+
+def write_checkpoint(path, number):
+    """Atomically record the last line number that was committed"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        file.write(str(number))
+    os.replace(temp_path, path)
+
+
+def validate(chunk):
+    """Validate a chunk of rows with the user schema
+
+    Rows that could not be parsed, that the schema rejects, e.g. for a
+    question missing from the catalog, or whose username or email is taken,
+    in the database or earlier in the chunk, are rejected.
+
+    Returns:
+        tuple: The valid (line number, data) pairs and the rejected
+            (line number, errors) pairs
+    """
+    valid, rejected = [], []
+
+    for number, row in chunk:
+        if isinstance(row, MalformedRow):
+            rejected.append((number, row.errors))
+            continue
+        try:
+            data = import_user_schema.load(row)
+        except ValidationError as error:
+            rejected.append((number, error.messages))
+            continue
+        valid.append((number, data))
+
+    usernames = {data['username'] for _, data in valid}
+    emails = {data['email'] for _, data in valid}
+    taken = {'username': set(), 'email': set()}
+    if valid:
+        for username, email in db.session.query(User.username, User.email) \
+                .filter(or_(User.username.in_(usernames),
+                            User.email.in_(emails))):
+            taken['username'].add(username)
+            taken['email'].add(email)
+
+    unique = []
+    for number, data in valid:
+        errors = {field: [UNIQUE_ERRORS[field]] for field in taken
+                  if data[field] in taken[field]}
+        if errors:
+            rejected.append((number, errors))
+            continue
+        taken['username'].add(data['username'])
+        taken['email'].add(data['email'])
+        unique.append((number, data))
+    return unique, rejected
+
+
+def hash_passwords(pool, passwords, hasher):
+    """Hash the passwords in the process pool, missing ones stay None"""
+    hashes = iter(pool.map(hasher.generate,
+                           [password for password in passwords if password],
+                           repeat(hasher.method), chunksize=16))
+    return [next(hashes) if password else None for password in passwords]
+
+
+def insert(rows, hashes, email):
+    """Insert a chunk of users with their answers, sentences and emails
+
+    Every table is written with one executemany, the caller commits.
+    """
+    now = datetime.utcnow()
+    users = []
+    for (_, data), password_hash in zip(rows, hashes):
+        user = User(username=data['username'], email=data['email'],
+                    password=password_hash, age=data.get('age'),
+                    sex=data.get('sex'), country=data.get('country'),
+                    password_reminder=data.get('password_reminder'),
+                    created_on=now)
+        user.schedule_password_reminder(now)
+        users.append(user)
+
+    db.session.execute(User.__table__.insert(), [
+        {column: getattr(user, column) for column in (
+            'username', 'email', 'password', 'age', 'sex', 'country',
+            'password_reminder', 'next_reminder_at', 'created_on')}
+        for user in users])
+
+    ids = dict(db.session.query(User.username, User.id).filter(
+        User.username.in_([user.username for user in users])))
+
+    answers, sentences, emails = [], [], []
+    for (_, data), user in zip(rows, users):
+        user.id = ids[user.username]
+        answers.extend({'text': answer.text, 'userId': user.id,
+                        'questionId': answer.questionId}
+                       for answer in data.get('answers') or [])
+        sentences.extend({'text': sentence.text, 'userId': user.id,
+                          'createdOn': now}
+                         for sentence in data.get('sentences') or [])
+        if email:
+            emails.append(dict(password_email(user, password=data.get('password')),
+                               status=OutboxEmail.PENDING, attempts=0,
+                               next_attempt_at=now, created_on=now))
+
+    if answers:
+        db.session.execute(Answer.__table__.insert(), answers)
+    if sentences:
+        db.session.execute(Sentence.__table__.insert(), sentences)
+    if emails:
+        db.session.execute(OutboxEmail.__table__.insert(), emails)
+
+
+def import_users(path, format=None, batch_size=500, workers=None,
+                 checkpoint=None, email=True, out=sys.stdout):
+    """Import users from a JSONL or CSV file in chunked transactions
+
+    Passwords are hashed in a process pool. After each committed chunk the
+    last line number is written to the checkpoint file, and a rerun resumes
+    after it.
+
+    Args:
+        path (str): The file
+        format (str): 'jsonl' or 'csv', guessed from the extension if None
+        batch_size (int): Rows per transaction
+        workers (int): Hashing processes, defaults to the CPU count
+        checkpoint (str): Checkpoint file, defaults to ``<path>.checkpoint``
+        email (bool): Queue the password email for every imported user
+        out (file): Where progress is reported
+
+    Returns:
+        tuple: Number of rows imported and rejected
+    """
+    checkpoint = checkpoint or path + '.checkpoint'
+    resume_after = read_checkpoint(checkpoint)
+    hasher = get_hasher()
+    rows = ((number, row) for number, row in read_rows(path, format)
+            if number > resume_after)
+    imported, rejected_count = 0, 0
+    start = perf_counter()
+
+    if resume_after:
+        print(f'Resuming after line {resume_after}', file=out)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing
+                             .get_context('spawn')) as pool:
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+
+            valid, rejected = validate(chunk)
+            for number, errors in rejected:
+                print(f'Line {number} rejected: {json.dumps(errors)}',
+                      file=out)
+
+            hashes = hash_passwords(
+                pool, [data.get('password') for _, data in valid], hasher)
+
+            try:
+                if valid:
+                    insert(valid, hashes, email)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            write_checkpoint(checkpoint, chunk[-1][0])
+            imported += len(valid)
+            rejected_count += len(rejected)
+            elapsed = perf_counter() - start
+            print(f'Imported {imported} users, rejected {rejected_count} '
+                  f'({imported / elapsed:.1f} users/s)', file=out)
+
+    return imported, rejected_count
@@ -0,0 +1,178 @@
+import atexit
+import json
+import logging
+import os
+from copy import copy
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+from time import perf_counter
+from uuid import uuid4
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# Longest X-Request-ID accepted from a client or proxy.
+REQUEST_ID_LENGTH = 64
+
+# Request fields copied onto every record logged while handling a request.
+REQUEST_FIELDS = ('request_id', 'method', 'path', 'route')
+
+_formatter = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the request fields when there are any"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in REQUEST_FIELDS + ('status', 'latency_ms'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class AsyncHandler(QueueHandler):
+    """Puts records on a queue that a listener thread writes to ``handlers``
+
+    The request thread only copies the record and its request fields, the
+    formatting and the file writes happen on the listener's thread. The
+    listener starts with the first record a process logs, so a worker
+    forked from a preloaded master, which does not inherit the master's
+    threads, starts its own.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(SimpleQueue())
+        self.handlers = handlers
+        self.listener = None
+        self._pid = None
+        self._lock = Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def _after_fork(self):
+        # The parent's lock may have been held by one of its threads.
+        self._lock = Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # The parent's listener owns the inherited queue.
+            self.queue = SimpleQueue()
+            self.listener = QueueListener(self.queue, *self.handlers,
+                                          respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Write the queued records and stop the listener"""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+    def prepare(self, record):
+        # Like QueueHandler.prepare, but the traceback stays apart from the
+        # message, for the JSON "exception" field.
+        record = copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or \
+                _formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+            record.route = request.endpoint
+        return record
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+
+def file_handler(app):
+    """A file handler rotating every LOG_ROTATE_WHEN (e.g. 'midnight') if it
+    is set, else every LOG_MAX_BYTES"""
+    from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+
+    path = app.config['LOG_FILE']
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if app.config['LOG_ROTATE_WHEN']:
+        return TimedRotatingFileHandler(
+            path, when=app.config['LOG_ROTATE_WHEN'], utc=True,
+            backupCount=app.config['LOG_BACKUP_COUNT'])
+    return RotatingFileHandler(
+        path, maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT'])
+
+
+def _before_request():
+    request_id = request.headers.get('X-Request-ID', '')[:REQUEST_ID_LENGTH]
+    g.request_id = request_id or uuid4().hex
+    g.log_start = perf_counter()
+
+
+def _after_request(response):
+    response.headers['X-Request-ID'] = g.request_id
+    g.log_status = response.status_code
+    return response
+
+
+def init_app(app):
+    """Tag every request with an id, and outside debug and testing, log
+    app.logger's records and a line per request as JSON, to stdout if
+    LOG_TO_STDOUT is set, else to LOG_FILE
+    """
+    app.config.setdefault('LOG_FILE', 'logs/cmp.log')
+    app.config.setdefault('LOG_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('LOG_ROTATE_WHEN', None)
+    app.config.setdefault('LOG_BACKUP_COUNT', 10)
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('LOG_REQUESTS', True)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    if app.debug or app.testing:
+        return
+
+    handler = logging.StreamHandler() if app.config['LOG_TO_STDOUT'] \
+        else file_handler(app)
+    handler.setFormatter(JSONFormatter())
+    # Flask's handler writes to stderr in the request thread.
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(AsyncHandler([handler]))
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+
+    if app.config['LOG_REQUESTS']:
+        @app.teardown_request
+        def log_request(error=None):
+            start = g.pop('log_start', None)
+            if start is None:
+                return
+            app.logger.info('request', extra={
+                'status': 500 if error is not None else g.get('log_status', 500),
+                'latency_ms': round((perf_counter() - start) * 1000, 3)})
@@ -0,0 +1,338 @@
+import atexit
+import glob
+import json
+import logging
+import os
+from bisect import bisect_left
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from api.errors import error_response
+
+# Upper bounds of the latency histogram buckets in seconds, +Inf is implied.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Flushes also run outside of the app context, e.g. at exit.
+logger = logging.getLogger(__name__)
+
+
+class Registry(object):
+    """Thread-safe request metrics of one process.
+
+    ``requests`` counts requests by (endpoint, method, status), the other
+    dicts are keyed by endpoint. Histogram buckets are stored
+    non-cumulative, the last one is +Inf. ``changes`` counts the updates.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.changes = 0
+        self.requests = {}
+        self.latency = {}
+        self.queries = {}
+        self.in_flight = {}
+
+    def started(self, endpoint):
+        with self.lock:
+            self.changes += 1
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def finished(self, endpoint, method, status, seconds, queries,
+                 query_seconds):
+        key = (endpoint, method, status)
+
+        with self.lock:
+            self.changes += 1
+            self.in_flight[endpoint] -= 1
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = \
+                    {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+            histogram['buckets'][bisect_left(BUCKETS, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+            totals = self.queries.setdefault(endpoint, [0, 0.0])
+            totals[0] += queries
+            totals[1] += query_seconds
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'requests': [list(key) + [count]
+                             for key, count in self.requests.items()],
+                'latency': {endpoint: dict(histogram, buckets=list(histogram['buckets']))
+                            for endpoint, histogram in self.latency.items()},
+                'queries': {endpoint: list(totals)
+                            for endpoint, totals in self.queries.items()},
+                'in_flight': dict(self.in_flight),
+            }
+
+
+def merge(snapshots):
+    """Sum the ``Registry.to_dict`` snapshots of several processes"""
+    merged = {'requests': {}, 'latency': {}, 'queries': {}, 'in_flight': {}}
+
+    for snapshot in snapshots:
+        for endpoint, method, status, count in snapshot['requests']:
+            key = (endpoint, method, status)
+            merged['requests'][key] = merged['requests'].get(key, 0) + count
+
+        for endpoint, histogram in snapshot['latency'].items():
+            total = merged['latency'].setdefault(
+                endpoint, {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in
+                                zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+
+        for endpoint, (count, seconds) in snapshot['queries'].items():
+            total = merged['queries'].setdefault(endpoint, [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+
+        for endpoint, count in snapshot.get('in_flight', {}).items():
+            merged['in_flight'][endpoint] = \
+                merged['in_flight'].get(endpoint, 0) + count
+    return merged
+
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels.items())
+
+
+def render(merged):
+    """Render merged metrics in the Prometheus text format"""
+    lines = [
+        '# HELP cmp_http_requests_total Requests by endpoint, method and status.',
+        '# TYPE cmp_http_requests_total counter',
+    ]
+    for (endpoint, method, status), count in sorted(merged['requests'].items()):
+        labels = _labels(endpoint=endpoint, method=method, status=status)
+        lines.append(f'cmp_http_requests_total{{{labels}}} {count}')
+
+    lines += [
+        '# HELP cmp_http_request_duration_seconds Request latency by endpoint.',
+        '# TYPE cmp_http_request_duration_seconds histogram',
+    ]
+    for endpoint, histogram in sorted(merged['latency'].items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), histogram['buckets']):
+            cumulative += count
+            labels = _labels(endpoint=endpoint, le=bound)
+            lines.append(f'cmp_http_request_duration_seconds_bucket{{{labels}}} '
+                         f'{cumulative}')
+        labels = _labels(endpoint=endpoint)
+        lines.append(f'cmp_http_request_duration_seconds_sum{{{labels}}} '
+                     f'{histogram["sum"]}')
+        lines.append(f'cmp_http_request_duration_seconds_count{{{labels}}} '
+                     f'{histogram["count"]}')
+
+    lines += [
+        '# HELP cmp_http_requests_in_progress Requests being served by endpoint.',
+        '# TYPE cmp_http_requests_in_progress gauge',
+    ]
+    for endpoint, count in sorted(merged['in_flight'].items()):
+        lines.append(f'cmp_http_requests_in_progress{{{_labels(endpoint=endpoint)}}} '
+                     f'{count}')
+
+    lines += [
+        '# HELP cmp_db_queries_total SQL statements executed by endpoint.',
+        '# TYPE cmp_db_queries_total counter',
+    ]
+    for endpoint, (count, _) in sorted(merged['queries'].items()):
+        lines.append(f'cmp_db_queries_total{{{_labels(endpoint=endpoint)}}} {count}')
+
+    lines += [
+        '# HELP cmp_db_query_duration_seconds_total Time spent in SQL statements by endpoint.',
+        '# TYPE cmp_db_query_duration_seconds_total counter',
+    ]
+    for endpoint, (_, seconds) in sorted(merged['queries'].items()):
+        lines.append(f'cmp_db_query_duration_seconds_total'
+                     f'{{{_labels(endpoint=endpoint)}}} {seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics(object):
+    """Per-endpoint request metrics, served at ``/api/metrics``.
+
+    Every process records into its own registry. With ``METRICS_DIR`` set,
+    e.g. under gunicorn, a thread in each worker also writes its registry
+    to ``<METRICS_DIR>/metrics-<pid>.json`` every ``METRICS_FLUSH_SECONDS``
+    if it changed, and the endpoint sums the files of every worker. The
+    thread starts with the first request a process serves, so a worker
+    forked from a preloaded master starts its own. Counters of exited
+    workers are kept, their in-flight gauges are dropped. Clear the
+    directory when the master starts.
+
+    The endpoint requires ``METRICS_TOKEN`` as a bearer token, without one
+    it is forbidden unless ``METRICS_PUBLIC`` is set.
+    """
+
+    def __init__(self, app=None):
+        self.registry = Registry()
+        self.directory = None
+        self.interval = None
+        self._flushed = None
+        self._flush_lock = Lock()
+        self._flusher_pid = None
+        self._start_lock = Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', None)
+        app.config.setdefault('METRICS_FLUSH_SECONDS', 5)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_PUBLIC', False)
+        app.extensions['metrics'] = self
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/api/metrics', 'metrics', self.view)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_execute)
+
+        directory = app.config['METRICS_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+            self.interval = app.config['METRICS_FLUSH_SECONDS']
+            atexit.register(self.flush, directory)
+
+    def _after_fork(self):
+        # The parent's locks may have been held by one of its threads.
+        self._flush_lock = Lock()
+        self._start_lock = Lock()
+
+    def _start_flusher(self):
+        with self._start_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            Thread(target=self._flush_changes, name='metrics-flush',
+                   daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _flush_changes(self):
+        while True:
+            sleep(self.interval)
+            if self.registry.changes != self._flushed:
+                self.flush(self.directory)
+
+    def _before_request(self):
+        g.metrics_endpoint = request.endpoint or 'unmatched'
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0.0
+        g.metrics_start = perf_counter()
+        self.registry.started(g.metrics_endpoint)
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, error=None):
+        # Runs once the response is sent, after a streamed body too.
+        if 'metrics_start' not in g:
+            return
+
+        self.registry.finished(
+            g.metrics_endpoint, request.method,
+            500 if error is not None else g.get('metrics_status', 500),
+            perf_counter() - g.metrics_start,
+            g.metrics_queries, g.metrics_query_seconds)
+        g.pop('metrics_start')
+
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def flush(self, directory):
+        """Atomically write this process' registry to ``directory``"""
+        with self._flush_lock:
+            # Read first, a change made while writing is written next time.
+            changes = self.registry.changes
+            try:
+                path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+                with open(path + '.tmp', 'w') as file:
+                    json.dump(self.registry.to_dict(), file)
+                os.replace(path + '.tmp', path)
+                self._flushed = changes
+            except OSError as error:
+                logger.warning(f'Could not write metrics: {error}')
+
+    def collect(self):
+        """
+        Sum the metrics of this process and, with METRICS_DIR, every worker
+
+        :return dict: The merged metrics, see ``merge``
+        """
+        snapshots = [self.registry.to_dict()]
+        directory = current_app.config['METRICS_DIR']
+
+        if directory:
+            pid = os.getpid()
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                worker = int(os.path.basename(path)[8:-5])
+                if worker == pid:
+                    continue
+                try:
+                    with open(path) as file:
+                        snapshot = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                if not _alive(worker):
+                    snapshot['in_flight'] = {}
+                snapshots.append(snapshot)
+        return merge(snapshots)
+
+    def view(self):
+        config = current_app.config
+        token = config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return error_response(401, 'Invalid metrics token.')
+        if not token and not config['METRICS_PUBLIC']:
+            return error_response(
+                403, 'Set METRICS_TOKEN, or METRICS_PUBLIC, to serve metrics.')
+
+        return Response(render(self.collect()),
+                        mimetype='text/plain; version=0.0.4')
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_start' in g:
+        conn.info.setdefault('metrics_query_start', []).append(perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if starts and has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_query_seconds += perf_counter() - starts.pop()
+
+
+metrics = Metrics()
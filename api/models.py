@@ -1,16 +1,20 @@
 from base64 import b64encode
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from hashlib import sha256
+from secrets import token_hex
 import jwt
-from sqlalchemy import or_
+from sqlalchemy import and_, event, inspect, or_
+from sqlalchemy.orm import make_transient_to_detached
 from flask import current_app
 from api import db
+from api.cache import token_cache, user_cache
+from api.hashing import get_hasher
 
 
 class Sentence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(255), nullable=False)
-    userId = db.Column(db.Integer, db.ForeignKey('user.id'))
+    userId = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     createdOn = db.Column(
         db.DateTime,
         default=datetime.utcnow,
@@ -21,10 +25,112 @@ class Sentence(db.Model):
         return f'<Sentence {self.text}>'
 
 
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+
+    QUESTIONS = 'question'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<CatalogVersion {self.name}={self.version}>'
+
+
+class RateLimit(db.Model):
+    """A token bucket, stored as the theoretical arrival time (GCRA) of
+    the next request in Unix seconds. A ``tat`` in the past is a full
+    bucket, so such rows can be deleted at any time."""
+    __tablename__ = 'rate_limit'
+
+    key = db.Column(db.String(128), primary_key=True)
+    tat = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<RateLimit {self.key}>'
+
+
+class RevokedToken(db.Model):
+    """A revoked token, by its ``jti``, or every token of a user issued
+    before ``issued_before``. Rows can be deleted once they expire."""
+    __tablename__ = 'revoked_token'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32))
+    userId = db.Column(db.Integer, db.ForeignKey('user.id'))
+    issued_before = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True, nullable=False)
+    created_on = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti or self.userId}>'
+
+
+class UserChange(db.Model):
+    """A change to a user's profile or password, from which every worker
+    evicts the user from its identity cache, see api.userchanges. Rows can
+    be deleted once the cache entries they evict have expired."""
+    __tablename__ = 'user_change'
+
+    id = db.Column(db.Integer, primary_key=True)
+    userId = db.Column(db.Integer, nullable=False)
+    created_on = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        index=True,
+        nullable=False
+    )
+
+    def __repr__(self):
+        return f'<UserChange {self.userId}>'
+
+
+class OutboxEmail(db.Model):
+    __tablename__ = 'outbox_email'
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(64), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(8), default=PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+    last_error = db.Column(db.String(255))
+    created_on = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+    sent_on = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_email_status_next_attempt_at',
+                 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} {self.status}>'
+
+
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(255), nullable=False)
-    answers = db.relationship('Answer', backref='answer')
+    # Every answer ever given to the question, never loaded implicitly.
+    answers = db.relationship(
+        'Answer', backref=db.backref('answer', lazy='raise_on_sql'),
+        lazy='raise_on_sql', passive_deletes=True)
 
     def __repr__(self):
         return f'<Question {self.text}>'
@@ -40,10 +146,6 @@ class Question(db.Model):
         """
         return cls.query.get(int(id))
 
-    def get_user_answer(self, user):
-        return Answer.query.with_parent(self).filter(
-            Answer.userId == user.id).first().text
-
 
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,10 +153,22 @@ class Answer(db.Model):
     userId = db.Column(db.Integer, db.ForeignKey('user.id'))
     questionId = db.Column(db.Integer, db.ForeignKey('question.id'))
 
+    __table_args__ = (
+        db.Index('ix_answer_userId_questionId',
+                 'userId', 'questionId', unique=True),
+    )
+
     def __repr__(self):
         return f'<Answer {self.text}>'
 
 
+# The user's unique indexes and the field each one guards.
+UNIQUE_INDEXES = {
+    'ix_user_username': 'username',
+    'ix_user_email': 'email',
+}
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(255), index=True, unique=True, nullable=False)
@@ -63,14 +177,26 @@ class User(db.Model):
     sex = db.Column(db.String(8))
     age = db.Column(db.Integer)
     password_reminder = db.Column(db.Integer)
+    next_reminder_at = db.Column(db.DateTime, index=True)
     country = db.Column(db.String(255))
     created_on = db.Column(
         db.DateTime,
         default=datetime.utcnow,
         nullable=False
     )
-    sentences = db.relationship('Sentence', backref='user')
-    answers = db.relationship('Answer', backref='user')
+    # Bumped whenever a field of the profile changes, see bump_user_version.
+    version = db.Column(db.Integer, default=1, nullable=False)
+    # Queries that need these say so, e.g. with selectinload(User.sentences);
+    # an implicit load raises instead of adding a query per user.
+    sentences = db.relationship(
+        'Sentence', backref=db.backref('user', lazy='raise_on_sql'),
+        lazy='raise_on_sql')
+    answers = db.relationship(
+        'Answer', backref=db.backref('user', lazy='raise_on_sql'),
+        lazy='raise_on_sql')
+
+    # Columns that are not part of the profile, changing them keeps the version.
+    UNVERSIONED = frozenset(['password', 'next_reminder_at', 'version'])
 
     
     def __init__(self, **kwargs):
@@ -90,6 +216,56 @@ class User(db.Model):
         """
         return cls.query.get(int(id))
 
+    @classmethod
+    def find_by_id_cached(cls, id):
+        """
+        Get a class instance given its id, from the identity cache if it
+        holds the user. The cached instance is attached to the current
+        session without querying the database.
+
+        :param id: ID
+        :type id: int
+        :return: Class instance
+        """
+        cache = user_cache()
+        values = cache.get(int(id))
+
+        if values is None:
+            user = cls.find_by_id(id)
+            if user is not None:
+                cache.set(user.id, {attr.key: getattr(user, attr.key)
+                                    for attr in inspect(cls).column_attrs})
+            return user
+
+        user = cls(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    @classmethod
+    def find_with_answer(cls, question_id, id=None, email=None, options=()):
+        """
+        Get a user, the question and the user's answer to it in one query.
+        The user is looked up by id, or by email if no id is given.
+
+        :param question_id: Question ID
+        :param options: Loader options for the user, e.g.
+            selectinload(User.sentences)
+        :return tuple: (user, question id, answer text), each is None if it
+            does not exist
+        """
+        query = db.session.query(cls, Question.id, Answer.text) \
+            .options(*options) \
+            .select_from(cls) \
+            .outerjoin(Question, Question.id == int(question_id)) \
+            .outerjoin(Answer, and_(Answer.userId == cls.id,
+                                    Answer.questionId == Question.id))
+
+        if id is not None:
+            query = query.filter(cls.id == int(id))
+        else:
+            query = query.filter(cls.email == email)
+        return query.first() or (None, None, None)
+
     @classmethod
     def find_by_email(cls, email):
         user = cls.query.filter(cls.email == email).first()
@@ -100,6 +276,51 @@ class User(db.Model):
         user = cls.query.filter(cls.username == username).first()
         return user
     
+    @classmethod
+    def find_taken(cls, username=None, email=None):
+        """
+        Check whether a username and an email are taken, in one query
+
+        :return set: The taken fields, 'username' and/or 'email'
+        """
+        clauses = []
+        if username:
+            clauses.append(cls.username == username)
+        if email:
+            clauses.append(cls.email == email)
+        if not clauses:
+            return set()
+
+        taken = set()
+        for row in db.session.query(cls.username, cls.email) \
+                .filter(or_(*clauses)).all():
+            if username and row.username == username:
+                taken.add('username')
+            if email and row.email == email:
+                taken.add('email')
+        return taken
+
+    @staticmethod
+    def unique_violation(error):
+        """
+        Get the unique field an IntegrityError was raised for
+
+        :param error: The IntegrityError
+        :return string: 'username', 'email' or None
+        """
+        # Postgres names the index. Its message also holds the conflicting
+        # value, which may contain the other field's name.
+        diag = getattr(error.orig, 'diag', None)
+        if diag is not None:
+            return UNIQUE_INDEXES.get(diag.constraint_name)
+
+        # SQLite's message is 'UNIQUE constraint failed: user.<column>'.
+        message = str(error.orig)
+        for field in ('username', 'email'):
+            if f'user.{field}' in message:
+                return field
+        return None
+
     @classmethod
     def find_by_identity(cls, identity):
         user = cls.query.filter(
@@ -109,12 +330,44 @@ class User(db.Model):
     @classmethod
     def hash_password(cls, password):
         if password:
-            return generate_password_hash(password)
+            return get_hasher().hash(password)
 
         return None
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        """
+        Check the password. The stored hash is upgraded and saved if it was
+        made with different parameters than the configured ones.
+
+        :param password: The plain text password
+        :return bool: Whether the password matches
+        """
+        if not self.password:
+            return False
+
+        hasher = get_hasher()
+        if not hasher.verify(self.password, password):
+            return False
+
+        if hasher.needs_rehash(self.password):
+            self.password = hasher.hash(password)
+            self.save()
+        return True
+
+    def next_reminder_time(self, now=None):
+        """
+        Get the time the next password reminder is due
+
+        :param now: The time to count from, defaults to utcnow()
+        :return datetime: None if the user has no reminder interval
+        """
+        if not self.password_reminder:
+            return None
+        return (now or datetime.utcnow()) + \
+            timedelta(days=self.password_reminder)
+
+    def schedule_password_reminder(self, now=None):
+        self.next_reminder_at = self.next_reminder_time(now)
 
     def encode_auth_token(self, password=None, reset_password=False):
         """Generates the auth token"""
@@ -129,6 +382,7 @@ class User(db.Model):
             payload = {
                 'exp': datetime.utcnow() + expiration,
                 'iat': datetime.utcnow(),
+                'jti': token_hex(8),
                 'sub': {
                     'id': self.id
                 }
@@ -150,29 +404,94 @@ class User(db.Model):
         """
         Decodes the auth token
 
+        Verified claims are cached by token digest until the token expires.
+
         :param string: token
-        :return dict: The user's identity
+        :return dict: The user's identity, with the token's jti, iat and exp
         """
+        cache = token_cache()
+        key = sha256(token.encode()).digest()
+        sub = cache.get(key)
+
+        if sub is not None:
+            return dict(sub)
+
         try:
             payload = jwt.decode(
                 token,
                 current_app.config.get('SECRET_KEY'),
                 algorithms='HS256'
             )
-            return payload.get('sub')
+            sub = payload.get('sub')
+            if isinstance(sub, dict) and 'exp' in payload:
+                sub = dict(sub, jti=payload.get('jti'),
+                           iat=payload.get('iat'), exp=payload['exp'])
+                cache.set(key, dict(sub), expires_at=payload['exp'])
+            return sub
         except jwt.ExpiredSignatureError:
             return 'Signature expired. Please log in again.'
         except jwt.InvalidTokenError:
             return 'Invalid token. Please log in again.'
 
+    def profile_changed(self):
+        """
+        Check whether a field of the profile has pending changes
+
+        :return bool: True if a column other than UNVERSIONED changed
+        """
+        state = inspect(self)
+        return any(state.attrs[attr.key].history.has_changes()
+                   for attr in state.mapper.column_attrs
+                   if attr.key not in self.UNVERSIONED)
+
+    def cached_copy_changed(self):
+        """
+        Check whether the profile or the password has pending changes, which
+        make the copies in the identity caches stale
+
+        :return bool:
+        """
+        return self.profile_changed() or \
+            inspect(self).attrs.password.history.has_changes()
+
     def save(self):
         """
-        Save a model instance.
+        Save a model instance. Changing the profile or the password evicts
+        the user from this worker's identity cache, the other workers evict
+        it on their next sync of the user_change table.
 
         :return: Model instance
         """
+        changed = inspect(self).persistent and self.cached_copy_changed()
+        id = self.id
+
         db.session.add(self)
         db.session.commit()
 
+        if changed:
+            user_cache().pop(id)
         return self
+
+
+@event.listens_for(User, 'before_update')
+def bump_user_version(mapper, connection, target):
+    # Incremented in SQL, so a stale instance, e.g. one from the identity
+    # cache, can't write a version that was already used.
+    if target.profile_changed():
+        target.version = User.version + 1
+
+
+@event.listens_for(User, 'before_update')
+def log_user_change(mapper, connection, target):
+    if not target.cached_copy_changed():
+        return
+
+    # In the same transaction as the change, older rows only evict entries
+    # that have expired by now.
+    now = datetime.utcnow()
+    config = current_app.config
+    table = UserChange.__table__
+    connection.execute(table.insert().values(userId=target.id, created_on=now))
+    connection.execute(table.delete().where(table.c.created_on < now - timedelta(
+        seconds=config['USER_CACHE_TTL'] + config['USER_CACHE_REFRESH_SECONDS'])))
     
\ No newline at end of file
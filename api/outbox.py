@@ -0,0 +1,172 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import sleep
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from sqlalchemy import update
+
+from api import db
+from api.models import OutboxEmail
+from api.email import deliver
+
+
+def create_session(pool_size):
+    """Create an HTTP session that keeps ``pool_size`` connections alive"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def claim_pending_emails(batch_size, now=None):
+    """Claim a batch of emails that are due to be sent.
+
+    Each claimed email is leased for ``OUTBOX_LEASE_SECONDS`` by moving its
+    ``next_attempt_at`` forward, so an email whose dispatcher died mid-send is
+    picked up again once the lease runs out. Rows are locked with
+    ``FOR UPDATE SKIP LOCKED`` on Postgres; other databases fall back to a
+    compare-and-set update.
+
+    Args:
+        batch_size (int): Maximum number of emails to claim
+        now (datetime): The current time, defaults to utcnow()
+
+    Returns:
+        list: The claimed emails as dicts
+    """
+    now = now or datetime.utcnow()
+    lease = now + timedelta(seconds=current_app.config['OUTBOX_LEASE_SECONDS'])
+    query = OutboxEmail.query.filter(
+        OutboxEmail.status == OutboxEmail.PENDING,
+        OutboxEmail.next_attempt_at <= now
+    ).order_by(OutboxEmail.next_attempt_at).limit(batch_size)
+
+    if db.engine.dialect.name == 'postgresql':
+        emails = query.with_for_update(skip_locked=True).all()
+    else:
+        emails = []
+        for email in query.all():
+            result = db.session.execute(
+                update(OutboxEmail)
+                .where(OutboxEmail.id == email.id,
+                       OutboxEmail.next_attempt_at == email.next_attempt_at)
+                .values(next_attempt_at=lease)
+                .execution_options(synchronize_session=False))
+            if result.rowcount == 1:
+                emails.append(email)
+
+    claimed = []
+    for email in emails:
+        email.next_attempt_at = lease
+        email.attempts += 1
+        claimed.append({
+            'id': email.id,
+            'attempts': email.attempts,
+            'recipient': email.recipient,
+            'subject': email.subject,
+            'html': email.html
+        })
+    db.session.commit()
+    return claimed
+
+
+def backoff(attempts, now=None):
+    """Get the time of the next attempt after ``attempts`` failed ones.
+
+    Exponential with full jitter, capped at ``OUTBOX_MAX_BACKOFF_SECONDS``.
+    """
+    config = current_app.config
+    delay = min(config['OUTBOX_MAX_BACKOFF_SECONDS'],
+                config['OUTBOX_BACKOFF_SECONDS'] * 2 ** (attempts - 1))
+    return (now or datetime.utcnow()) + \
+        timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def record_result(email, error=None):
+    """Mark a claimed email as sent, or schedule its retry"""
+    now = datetime.utcnow()
+
+    # The html embeds the password token, whose claims hold the plaintext
+    # password. Don't keep it once the email is delivered or given up on.
+    if error is None:
+        values = {'status': OutboxEmail.SENT, 'sent_on': now, 'html': '',
+                  'last_error': None}
+    elif email['attempts'] >= current_app.config['OUTBOX_MAX_ATTEMPTS']:
+        values = {'status': OutboxEmail.FAILED, 'html': '',
+                  'last_error': error[:255]}
+    else:
+        values = {'next_attempt_at': backoff(email['attempts'], now),
+                  'last_error': error[:255]}
+
+    db.session.execute(
+        update(OutboxEmail).where(OutboxEmail.id == email['id'])
+        .values(**values).execution_options(synchronize_session=False))
+
+
+def dispatch(session, executor, batch_size=None):
+    """Send every pending email that is due
+
+    Args:
+        session (requests.Session): The pooled HTTP session
+        executor (ThreadPoolExecutor): Caps the concurrent deliveries
+        batch_size (int): Emails claimed per transaction
+
+    Returns:
+        tuple: Number of emails sent and failed
+    """
+    config = current_app.config
+    batch_size = batch_size or config['OUTBOX_BATCH_SIZE']
+    sent, failed = 0, 0
+
+    while True:
+        emails = claim_pending_emails(batch_size)
+        futures = [executor.submit(deliver, session, config, email)
+                   for email in emails]
+
+        for email, future in zip(emails, futures):
+            try:
+                future.result()
+                record_result(email)
+                sent += 1
+            except requests.RequestException as error:
+                current_app.logger.warning(
+                    f'Email {email["id"]} attempt {email["attempts"]} '
+                    f'failed: {error}')
+                record_result(email, str(error))
+                failed += 1
+        db.session.commit()
+
+        if len(emails) < batch_size:
+            return sent, failed
+
+
+def run(interval=None, once=False):
+    """Drain the outbox, polling every ``interval`` seconds unless ``once``"""
+    config = current_app.config
+    interval = interval or config['OUTBOX_POLL_SECONDS']
+    concurrency = config['OUTBOX_CONCURRENCY']
+    session = create_session(concurrency)
+
+    with ThreadPoolExecutor(max_workers=concurrency,
+                            thread_name_prefix='outbox') as executor:
+        while True:
+            try:
+                sent, failed = dispatch(session, executor)
+                if sent or failed:
+                    current_app.logger.info(
+                        f'Outbox: sent {sent}, failed {failed} emails')
+            except Exception as error:
+                db.session.rollback()
+                current_app.logger.error(f'Outbox dispatch failed: {error}')
+                if once:
+                    raise
+            finally:
+                db.session.remove()
+
+            if once:
+                return sent, failed
+            sleep(interval)
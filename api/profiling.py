@@ -0,0 +1,225 @@
+import cProfile
+import hmac
+import json
+import os
+import random
+import sys
+from collections import Counter
+from datetime import datetime
+from hashlib import sha256
+from threading import Event, Thread, get_ident
+from time import perf_counter, time
+
+from flask import current_app, g, request
+
+# Requests carrying a valid token in this header are profiled.
+HEADER = 'X-Profile'
+
+MODES = ('cprofile', 'sample')
+
+
+def _signature(key, expires):
+    return hmac.new(key.encode(), f'profile:{expires}'.encode(),
+                    sha256).hexdigest()
+
+
+def _key(app):
+    return app.config['PROFILE_SECRET'] or app.config['SECRET_KEY']
+
+
+def make_token(seconds):
+    """
+    Get an X-Profile header value that profiles requests for ``seconds``
+
+    :param seconds: Lifetime of the token
+    :return str: '<expires>.<signature>'
+    """
+    expires = int(time()) + seconds
+    return f'{expires}.{_signature(_key(current_app), expires)}'
+
+
+def verify_token(value, key):
+    """
+    Check an X-Profile header value
+
+    :param value: The header value
+    :param key: The signing key
+    :return bool: Whether it is signed with ``key`` and not expired
+    """
+    expires, _, signature = value.partition('.')
+    if not expires.isdigit() or int(expires) < time():
+        return False
+    return hmac.compare_digest(signature, _signature(key, expires))
+
+
+class Sampler(object):
+    """Samples the stack of one thread from a helper thread and counts the
+    collapsed stacks, the input of flamegraph.pl and speedscope.
+
+    The helper needs the GIL to take a sample, so a thread that holds it
+    for longer than the interval is sampled less often.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:'
+                             f'{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class Profiler(object):
+    """Profiles sampled requests, and those with a signed X-Profile header.
+
+    Each profile is written to ``PROFILE_DIR`` as a pstats file (cProfile)
+    or collapsed stacks (sample), next to a JSON file with the route,
+    status, duration and, when metrics are enabled, the request's SQL
+    statements and time. Only the newest ``PROFILE_MAX_FILES`` profiles are
+    kept. With PROFILE_ENABLED off no hook is registered.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_ENABLED', False)
+        app.config.setdefault('PROFILE_MODE', 'cprofile')
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_SECRET', None)
+        app.config.setdefault('PROFILE_INTERVAL_MS', 1)
+        app.config.setdefault('PROFILE_DIR', 'profiles')
+        app.config.setdefault('PROFILE_MAX_FILES', 100)
+
+        if not app.config['PROFILE_ENABLED']:
+            return
+
+        if app.config['PROFILE_MODE'] not in MODES:
+            raise ValueError(f"PROFILE_MODE must be one of {', '.join(MODES)}")
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def _wanted(config):
+        rate = config['PROFILE_SAMPLE_RATE']
+        if rate and random.random() < rate:
+            return True
+
+        token = request.headers.get(HEADER)
+        return token is not None and \
+            verify_token(token, _key(current_app))
+
+    def _before_request(self):
+        config = current_app.config
+        if not self._wanted(config):
+            return
+
+        if config['PROFILE_MODE'] == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            profile = Sampler(get_ident(), config['PROFILE_INTERVAL_MS'] / 1000)
+            profile.start()
+        g.profile = profile
+        g.profile_start = perf_counter()
+
+    def _after_request(self, response):
+        if 'profile' in g:
+            g.profile_status = response.status_code
+        return response
+
+    def _teardown_request(self, error=None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+
+        if isinstance(profile, cProfile.Profile):
+            profile.disable()
+        else:
+            profile.stop()
+
+        annotations = {
+            'route': request.endpoint or 'unmatched',
+            'method': request.method,
+            'path': request.path,
+            'request_id': g.get('request_id'),
+            'status': 500 if error is not None else g.get('profile_status', 500),
+            'duration_ms': round((perf_counter() - g.pop('profile_start')) * 1000, 3),
+        }
+        if 'metrics_queries' in g:
+            annotations['sql_statements'] = g.metrics_queries
+            annotations['sql_ms'] = round(g.metrics_query_seconds * 1000, 3)
+
+        try:
+            self.write(profile, annotations)
+        except OSError as error:
+            current_app.logger.warning(f'Could not write profile: {error}')
+
+    def write(self, profile, annotations):
+        """
+        Write a profile and its annotations, then drop the oldest profiles
+        beyond PROFILE_MAX_FILES
+
+        :param profile: The request's cProfile.Profile or Sampler
+        :param annotations: Route, status, timings... of the request
+        :return str: The path of the profile, without extension
+        """
+        config = current_app.config
+        directory = config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+
+        name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{annotations['route']}"
+        path = os.path.join(directory, name)
+
+        if isinstance(profile, cProfile.Profile):
+            profile.dump_stats(path + '.pstats')
+        else:
+            profile.dump(path + '.folded')
+            annotations['samples'] = sum(profile.stacks.values())
+        with open(path + '.json', 'w') as file:
+            json.dump(annotations, file, indent=2)
+
+        self.prune(directory, config['PROFILE_MAX_FILES'])
+        return path
+
+    @staticmethod
+    def prune(directory, max_files):
+        """Delete the oldest profiles, they are named by time"""
+        names = sorted(name[:-5] for name in os.listdir(directory)
+                       if name.endswith('.json'))
+
+        for name in names[:max(0, len(names) - max_files)]:
+            for extension in ('.pstats', '.folded', '.json'):
+                try:
+                    os.remove(os.path.join(directory, name + extension))
+                except FileNotFoundError:
+                    pass
+
+
+profiler = Profiler()
@@ -0,0 +1,125 @@
+import random
+from functools import wraps
+from hashlib import sha256
+from time import time
+
+from flask import current_app, request
+from sqlalchemy import case, exc, select
+
+from api import db
+from api.errors import too_many_requests
+from api.models import RateLimit
+
+# Share of hits that also delete the full buckets, to keep the table small.
+PRUNE_PROBABILITY = 0.001
+
+
+def hit(key, requests, seconds, now=None):
+    """Take a token from a bucket that holds ``requests`` tokens and refills
+    completely in ``seconds``
+
+    The bucket lives in the rate_limit table so every worker shares it. It
+    is updated with one conditional UPDATE, committed on its own connection
+    outside the request's transaction.
+
+    Args:
+        key (str): The bucket
+        requests (int): Burst size
+        seconds (int): Refill period
+        now (float): Unix time, defaults to now
+
+    Returns:
+        float: 0 if the request is allowed, else the seconds until it would be
+    """
+    now = now or time()
+    interval = seconds / requests
+    table = RateLimit.__table__
+    tat = case((table.c.tat > now, table.c.tat), else_=now) + interval
+
+    try:
+        with db.engine.begin() as connection:
+            if random.random() < PRUNE_PROBABILITY:
+                connection.execute(table.delete().where(table.c.tat < now))
+
+            result = connection.execute(
+                table.update()
+                .where(table.c.key == key)
+                .where(tat - now <= seconds)
+                .values(tat=tat))
+            if result.rowcount:
+                return 0
+
+            current = connection.execute(
+                select(table.c.tat).where(table.c.key == key)).scalar()
+            if current is not None:
+                return current + interval - seconds - now
+
+            connection.execute(
+                table.insert().values(key=key, tat=now + interval))
+            return 0
+    except exc.IntegrityError:
+        # Another worker created the bucket first, let this one through.
+        return 0
+
+
+def init_app(app):
+    """Warn when the client IP can't be trusted, see RATE_LIMIT_IP_ENABLED"""
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+    app.config.setdefault('RATE_LIMIT_IP_ENABLED', False)
+
+    if app.config['RATE_LIMIT_ENABLED'] and not app.config['TRUSTED_PROXIES']:
+        if app.config['RATE_LIMIT_IP_ENABLED']:
+            app.logger.warning(
+                'Rate limiting by IP with TRUSTED_PROXIES=0: behind a proxy '
+                'every client shares the proxy\'s bucket.')
+        else:
+            app.logger.warning(
+                'TRUSTED_PROXIES is 0, requests are only rate limited per '
+                'identity. Set it to the number of proxies in front of the '
+                'app, or RATE_LIMIT_IP_ENABLED=true if there are none.')
+
+
+def rate_limit(field):
+    """Limit a view per client IP, if RATE_LIMIT_IP_ENABLED, and per
+    identity, the ``field`` of the JSON body, e.g. the email. Over the
+    limit the view is not called and the client gets a 429 with
+    Retry-After.
+
+    The limiter fails open: if the database can't be reached, requests are
+    let through.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+
+            if not config['RATE_LIMIT_ENABLED']:
+                return func(*args, **kwargs)
+
+            buckets = []
+            if config['RATE_LIMIT_IP_ENABLED']:
+                buckets.append((f'ip:{request.remote_addr}',
+                                config['RATE_LIMIT_IP_REQUESTS'],
+                                config['RATE_LIMIT_IP_SECONDS']))
+
+            data = request.get_json(silent=True)
+            value = data.get(field) if isinstance(data, dict) else None
+            if value:
+                digest = sha256(
+                    str(value).strip().lower().encode()).hexdigest()
+                buckets.append((f'identity:{digest}',
+                                config['RATE_LIMIT_IDENTITY_REQUESTS'],
+                                config['RATE_LIMIT_IDENTITY_SECONDS']))
+
+            for key, requests, seconds in buckets:
+                try:
+                    wait = hit(key, requests, seconds)
+                except exc.SQLAlchemyError as error:
+                    current_app.logger.warning(f'Rate limiter failed: {error}')
+                    break
+                if wait > 0:
+                    return too_many_requests(
+                        'Too many attempts, please try again later.', wait)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,93 @@
+from datetime import datetime
+from time import sleep
+
+from flask import current_app
+from sqlalchemy import update
+
+from api import db
+from api.models import User
+from api.email import queue_password_email
+
+
+def claim_due_reminders(batch_size, now=None):
+    """Claim a batch of users whose password reminder is due.
+
+    Claiming moves each user's ``next_reminder_at`` forward by their reminder
+    interval in the caller's transaction, so a reminder is handed to exactly one
+    scheduler even when several of them run. On Postgres the due rows are
+    locked with ``FOR UPDATE SKIP LOCKED`` so concurrent schedulers split the
+    batch between them; databases without row locks (SQLite) fall back to a
+    compare-and-set update on ``next_reminder_at``.
+
+    Args:
+        batch_size (int): Maximum number of users to claim
+        now (datetime): The current time, defaults to utcnow()
+
+    Returns:
+        list: The claimed users
+    """
+    now = now or datetime.utcnow()
+    query = User.query.filter(User.next_reminder_at <= now) \
+        .order_by(User.next_reminder_at).limit(batch_size)
+
+    if db.engine.dialect.name == 'postgresql':
+        users = query.with_for_update(skip_locked=True).all()
+        for user in users:
+            user.schedule_password_reminder(now)
+        return users
+
+    claimed = []
+    for user in query.all():
+        due = user.next_reminder_at
+        result = db.session.execute(
+            update(User)
+            .where(User.id == user.id, User.next_reminder_at == due)
+            .values(next_reminder_at=user.next_reminder_time(now))
+            .execution_options(synchronize_session=False))
+        if result.rowcount == 1:
+            claimed.append(user)
+    return claimed
+
+
+def send_due_reminders(batch_size=None):
+    """Queue the password reminder email for every user that is due
+
+    The claim and the outbox emails are committed together, so a reminder
+    is neither lost nor queued twice.
+
+    Args:
+        batch_size (int): Users claimed per transaction
+
+    Returns:
+        int: Number of reminders queued
+    """
+    batch_size = batch_size or current_app.config['REMINDER_BATCH_SIZE']
+    sent = 0
+
+    while True:
+        users = claim_due_reminders(batch_size)
+
+        for user in users:
+            queue_password_email(user, reset=True)
+        db.session.commit()
+        sent += len(users)
+
+        if len(users) < batch_size:
+            return sent
+
+
+def run(interval=None):
+    """Send due reminders forever, polling every ``interval`` seconds"""
+    interval = interval or current_app.config['REMINDER_POLL_SECONDS']
+
+    while True:
+        try:
+            sent = send_due_reminders()
+            if sent:
+                current_app.logger.info(f'Queued {sent} password reminders')
+        except Exception as error:
+            db.session.rollback()
+            current_app.logger.error(f'Password reminder run failed: {error}')
+        finally:
+            db.session.remove()
+        sleep(interval)
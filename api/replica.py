@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+
+REPLICA = 'replica'
+
+
+def reading_replica():
+    """Whether the current request's reads go to the read replica"""
+    return has_app_context() and g.get('db_replica', False)
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends queries to the ``replica`` bind while
+    ``reading_replica()``. Flushes always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self._flushing and reading_replica() and \
+                REPLICA in (self.app.config['SQLALCHEMY_BINDS'] or {}):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_replica(func):
+    """Run a read-only view against the replica, if one is configured"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.db_replica = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            g.db_replica = False
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside a read_replica view, e.g. to see a row
+    the replica has not caught up with yet."""
+    previous = g.get('db_replica', False)
+    g.db_replica = False
+    try:
+        yield
+    finally:
+        g.db_replica = previous
@@ -1,82 +1,104 @@
-import random
-import re
-from threading import Thread
 from sqlalchemy import exc
-from marshmallow import ValidationError, Schema, fields
-from flask import request, url_for, Blueprint, jsonify, current_app
+from sqlalchemy.orm import selectinload
+from marshmallow import ValidationError
+from flask import request, url_for, Blueprint, jsonify, current_app, \
+    Response, g, stream_with_context
 
 from api import db
-from api.schema import QuestionSchema, UserSchema
-from api.models import Question, User
-from api.errors import error_response, bad_request, server_error
-from api.utils import generate_password, generate_passwords, authenticate, password_reminder
-from api.email import send_password_email
+from api.catalog import catalog
+from api.denylist import denylist
+from api.export import TABLES, iter_ndjson
+from api.schema import UNIQUE_ERRORS, email_answer_schema, email_schema, login_schema, \
+    profile_schema, token_answer_schema, user_schema, validate_login_schema
+from api.models import User
+from api.replica import read_replica
+from api.errors import TooManyRequests, error_response, bad_request, server_error
+from api.ratelimit import rate_limit
+from api.utils import admin_required, analyze_sentences, authenticate, conditional, \
+    draw_passwords, generate_password, verify_answer
+from api.email import queue_password_email
 
 users = Blueprint('users', __name__, url_prefix='/api/users')
 sentences = Blueprint('sentences', __name__, url_prefix='/api/sentences')
 
 
-@sentences.route('/ping')
-def ping():
-    return {"message": "Sentences Route!"}
+def password_count():
+    """
+    Get the number of passwords the client asked for with ?count=
 
+    :return tuple: The count and None, or None and an error response if it
+        is not between 1 and PASSWORD_CANDIDATES_MAX
+    """
+    count = request.args.get('count', 3, type=int)
+    maximum = current_app.config['PASSWORD_CANDIDATES_MAX']
 
-@sentences.route('/validate', methods=['POST'])
-def validate_sentence():
+    if 1 <= count <= maximum:
+        return count, None
+    return None, bad_request(
+        f'You can only request between 1 and {maximum} passwords')
+
+
+def load_sentences():
+    """
+    Validate the request's sentences
+
+    :return tuple: The sentence analysis and None, or None and an error
+        response
+    """
     post_data = request.get_json()
 
     if not post_data:
-        return bad_request("No input data provided")
+        return None, bad_request("No input data provided")
 
-    if len(post_data) != 3:
-        return bad_request('You must enter 3 sentences')
+    if not isinstance(post_data, list) or len(post_data) != 3 or \
+            not all(isinstance(sentence, str) for sentence in post_data):
+        return None, bad_request('You must enter 3 sentences')
 
     try:
-        sentences = []
-        for sentence in post_data:
-            count = len(re.findall(r'\w+', sentence))
-            if count > 10 or count < 5:
-                raise ValidationError(
-                    'All the sentences must be between 5 and 10 words')
-            sentences.append(sentence)
+        return analyze_sentences(post_data), None
     except ValidationError as err:
-        return error_response(422, err.messages[0])
+        return None, error_response(422, err.messages[0])
+    except ValueError as err:
+        return None, error_response(422, str(err))
 
-    try:
-        questions = Question.query.all()
 
-        passwords = generate_passwords(sentences, 3)
+@sentences.route('/ping')
+def ping():
+    return {"message": "Sentences Route!"}
+
+
+@sentences.route('/validate', methods=['POST'])
+@read_replica
+def validate_sentence():
+    analysis, error = load_sentences()
+    if error:
+        return error
+
+    n, error = password_count()
+    if error:
+        return error
+
+    try:
         return {
-            'passwords': passwords,
-            'questions': QuestionSchema().dump(questions, many=True)
+            'passwords': draw_passwords(analysis.pools, n),
+            'questions': catalog.all()
         }
     except exc.SQLAlchemyError as err:
-        print(err)
+        current_app.logger.error(f'Could not load the question catalog: {err}')
         return server_error('Something went wrong, please try again.')
 
 
 @sentences.route('/passwords', methods=['POST'])
 def get_passwords():
-    post_data = request.get_json()
-
-    if not post_data:
-        return bad_request("No input data provided")
+    analysis, error = load_sentences()
+    if error:
+        return error
 
-    if len(post_data) != 3:
-        return bad_request('You must enter 3 sentences')
+    n, error = password_count()
+    if error:
+        return error
+    return {'passwords': draw_passwords(analysis.pools, n)}
 
-    try:
-        sentences = []
-        for sentence in post_data:
-            count = len(re.findall(r'\w+', sentence))
-            if count > 10 or count < 5:
-                raise ValidationError(
-                    'All the sentences must be between 5 and 10 words')
-            sentences.append(sentence)
-    except ValidationError as err:
-        return error_response(422, err.messages[0])
-    return {'passwords': generate_passwords(sentences, 3)}
-    
 
 @users.route('/ping')
 def ping():
@@ -91,7 +113,7 @@ def validate_user():
         return bad_request("No input data provided")
 
     try:
-        data = UserSchema().load(post_data, partial=('answers', 'sentences',))
+        data = user_schema.load(post_data, partial=('answers', 'sentences',))
     except ValidationError as err:
         return error_response(422, err.messages)
     return {}
@@ -105,68 +127,55 @@ def create_user():
         return bad_request("No input data provided")
 
     try:
-        data = UserSchema().load(post_data)
+        data = user_schema.load(post_data)
     except ValidationError as err:
         return error_response(422, err.messages)
 
-
-    email = data.get('email')
-    username = data.get('username')
-    answers = data.get('answers')
-    sentences = data.get('sentences')
-
-    if User.find_by_username(username):
-        return bad_request(
-            {'username': ['A user with that username already exists']}
-        )
-
-    if User.find_by_email(email):
-        return bad_request(
-            {'email': ['A user with that email already exists']}
-        )
-
     user = User()
-    user.email = email
-    user.username = username
+    user.email = data.get('email')
+    user.username = data.get('username')
     user.country = data.get('country')
     user.age = data.get('age')
     user.sex = data.get('sex')
     user.password = User.hash_password(data.get('password'))
     user.password_reminder = data.get('password_reminder')
-    user.answers = answers
-    user.sentences = sentences
+    user.schedule_password_reminder()
+    user.answers = data.get('answers')
+    user.sentences = data.get('sentences')
 
+    # The user, answers and sentences are inserted in a single flush, and
+    # the response is built before the commit expires the user.
     try:
-        user.save()
-    except:
+        db.session.add(user)
+        db.session.flush()
+        queue_password_email(user, password=data.get('password'))
+        token = user.encode_auth_token()
+        location = url_for('users.get_user', id=user.id)
+        db.session.commit()
+    except exc.IntegrityError as error:
         db.session.rollback()
-        return server_error('Something went wrong, please try again.')
-    try:
-        send_password_email(user, password=data.get('password'))
-        app = current_app._get_current_object()
-        Thread(target=password_reminder, args=(app, user,), \
-            daemon=True, name='Password Reminder').start()
+        field = User.unique_violation(error)
+        if field is None:
+            return server_error('Something went wrong, please try again.')
+        # Another signup took the username or email after validation.
+        return bad_request({field: [UNIQUE_ERRORS[field]]})
     except Exception:
-        return server_error('An error occurred while trying to send \
-            your password, please try again.')
+        db.session.rollback()
+        return server_error('Something went wrong, please try again.')
 
-    response = jsonify({'token': user.encode_auth_token()})
+    response = jsonify({'token': token})
     response.status_code = 201
-    response.headers['Location'] = url_for('users.get_user', id=user.id)
+    response.headers['Location'] = location
     return response
 
 
 @users.route('/validate-login', methods=['POST'])
+@rate_limit('identity')
 def validate_login():
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({
-        "identity": fields.Str(required=True),
-        "password": fields.Str(required=True),
-    })
-
     try:
-        data = RequestSchema().load(post_data)
+        data = validate_login_schema.load(post_data)
     except ValidationError as error:
         return bad_request(error.messages)
 
@@ -178,71 +187,46 @@ def validate_login():
         user = User.find_by_identity(data['identity'])
 
         if user and user.check_password(data['password']):
-            questions = Question.query.all()
-            question = random.choice(questions)
-
             return {
                 'userId': user.id,
-                'question': QuestionSchema().dump(question)
+                'question': catalog.random()
             }
         else:
             return error_response(401, 'Invalid credentials.')
+    except TooManyRequests:
+        raise
     except Exception:
         return server_error('Something went wrong, please try again.')
 
 
 @users.route('/login', methods=['POST'])
+@rate_limit('userId')
 def login():
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({
-        "userId": fields.Str(required=True),
-        "questionId": fields.Str(required=True),
-        "answer": fields.Str(required=True)
-    })
-
     try:
-        data = RequestSchema().load(post_data)
+        data = login_schema.load(post_data)
     except ValidationError as error:
         return error_response(422, error.messages)
 
     if data is None:
         return bad_request("No input data provided")
 
-    try:
-        user = User.find_by_id(data['userId'])
+    user, error = verify_answer(data['questionId'], data['answer'],
+                                'Invalid credentials', id=data['userId'])
 
-        if user is None:
-            return error_response(401, 'User does not exist.')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
-
-    try:
-        question = Question.find_by_id(data['questionId'])
-
-        if question is None:
-            return error_response(401, 'That question does not exist.')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
-
-    try:
-        answer_text = question.get_user_answer(user)
-
-        if answer_text != data['answer']:
-            return error_response(401, 'Invalid credentials')
-        return {'token': user.encode_auth_token()}
-    except Exception:
-        return server_error('Something went wrong, please try again.')
+    if error:
+        return error
+    return {'token': user.encode_auth_token()}
 
 
 @users.route('/validate-user', methods=['POST'])
+@read_replica
 def validate_user_email():
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({"email": fields.Email(required=True)})
-
     try:
-        data = RequestSchema().load(post_data)
+        data = email_schema.load(post_data)
     except ValidationError as error:
         return bad_request(error.messages[0])
 
@@ -253,87 +237,70 @@ def validate_user_email():
         return bad_request('User does not exist.')
 
     try:
-        questions = Question.query.all()
-        return QuestionSchema().dump(random.choice(questions))
+        return catalog.random()
     except exc.SQLAlchemyError as err:
-        print(err)
+        current_app.logger.error(f'Could not load the question catalog: {err}')
         return server_error('Something went wrong, please try again.')
 
 
 @users.route('/forgot-password', methods=['POST'])
+@rate_limit('email')
 def forgot_password():
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({
-        "email": fields.Email(required=True),
-        "questionId": fields.Str(required=True),
-        "answer": fields.Str(required=True)
-    })
-
     try:
-        data = RequestSchema().load(post_data)
+        data = email_answer_schema.load(post_data)
     except ValidationError as error:
         return bad_request(error.messages)
 
     if data is None:
         return bad_request("No input data provided")
 
-    try:
-        user = User.find_by_email(data['email'])
-
-        if user is None:
-            return error_response(401, 'User does not exist.')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
+    user, error = verify_answer(data['questionId'], data['answer'],
+                                'Incorrect answer', email=data['email'],
+                                options=[selectinload(User.sentences)])
 
-    try:
-        question = Question.find_by_id(data['questionId'])
+    if error:
+        return error
 
-        if question is None:
-            return error_response(401, 'That question does not exist.')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
-
-    try:
-        answer_text = question.get_user_answer(user)
-
-        if answer_text != data['answer']:
-            return error_response(401, 'Incorrect answer')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
-    
     password = generate_password([sentence.text for sentence in user.sentences])
     user.password = User.hash_password(password)
 
     try:
+        # Sessions and reset links issued with the old password end here.
+        denylist.revoke_user(user.id)
+        queue_password_email(user, password=password, reset=True)
         user.save()
-        send_password_email(user, password=password, reset=True)
         return {'message': 'A message has been sent to your email'}
     except Exception:
+        db.session.rollback()
         return server_error('An error occurred while trying to send you a reset link. Please try again.')
 
 
 @users.route('/question', methods=['GET'])
+@read_replica
 def get_question():
     try:
-        question = random.choice(Question.query.all())
+        snapshot = catalog.snapshot()
+        question = catalog.random(snapshot)
     except Exception:
         return server_error('Something went wrong, please try again.')
-    return {'question': QuestionSchema().dump(question)}
-    
+
+    # The question is drawn at random, so a client only gets a 304 when the
+    # draw repeats the question it has. Without the cache there's no version.
+    if snapshot.version is None:
+        return {'question': question}
+    return conditional(f"question-{snapshot.version}-{question['id']}",
+                       lambda: {'question': question})
+
 
 @users.route('/get-password', methods=['POST'])
+@rate_limit('token')
 def view_password():
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({
-        "token": fields.Str(required=True),
-        "questionId": fields.Str(required=True),
-        "answer": fields.Str(required=True)
-    })
-
     try:
-        data = RequestSchema().load(post_data)
+        data = token_answer_schema.load(post_data)
     except ValidationError as error:
         return bad_request(error.messages)
 
@@ -345,26 +312,15 @@ def view_password():
     if not isinstance(payload, dict):
         return error_response(401, message=payload)
 
-    user = User.find_by_id(payload.get('id'))
+    if denylist.is_revoked(payload):
+        return error_response(401, message='Token revoked.')
 
-    if user is None:
-        return error_response(401, message='Invalid token.')
-    
-    try:
-        question = Question.find_by_id(data['questionId'])
-
-        if question is None:
-            return error_response(401, 'That question does not exist.')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
-
-    try:
-        answer_text = question.get_user_answer(user)
+    user, error = verify_answer(data['questionId'], data['answer'],
+                                'Incorrect answer', id=payload.get('id'),
+                                unknown_user_message='Invalid token.')
 
-        if answer_text != data['answer']:
-            return error_response(401, 'Incorrect answer')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
+    if error:
+        return error
     return {'password': payload['password']}
 
 
@@ -373,10 +329,8 @@ def view_password():
 def validate_email(user):
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({"email": fields.Email(required=True)})
-
     try:
-        data = RequestSchema().load(post_data)
+        data = email_schema.load(post_data)
     except ValidationError as error:
         return bad_request(error.messages[0])
 
@@ -387,10 +341,9 @@ def validate_email(user):
         return bad_request("A user with that email already exists")
 
     try:
-        questions = Question.query.all()
-        return QuestionSchema().dump(random.choice(questions))
+        return catalog.random()
     except exc.SQLAlchemyError as err:
-        print(err)
+        current_app.logger.error(f'Could not load the question catalog: {err}')
         return server_error('Something went wrong, please try again.')
 
 
@@ -399,14 +352,8 @@ def validate_email(user):
 def change_email(user):
     post_data = request.get_json()
 
-    RequestSchema = Schema.from_dict({
-        "email": fields.Email(required=True),
-        "questionId": fields.Str(required=True),
-        "answer": fields.Str(required=True)
-    })
-
     try:
-        data = RequestSchema().load(post_data)
+        data = email_answer_schema.load(post_data)
     except ValidationError as error:
         return bad_request(error.messages)
 
@@ -416,23 +363,16 @@ def change_email(user):
     if User.find_by_email(data['email']):
         return bad_request("A user with that email already exists")
 
-    try:
-        question = Question.find_by_id(data['questionId'])
+    user, error = verify_answer(data['questionId'], data['answer'],
+                                'Invalid credentials', id=user.id)
 
-        if question is None:
-            return error_response(401, 'That question does not exist.')
-    except Exception:
-        return server_error('Something went wrong, please try again.')
+    if error:
+        return error
 
     try:
-        answer_text = question.get_user_answer(user)
-
-        if answer_text != data.get('answer'):
-            return error_response(401, 'Invalid credentials')
-
         user.email = data.get('email')
         user.save()
-        return UserSchema(exclude=['answers', 'sentences']).dump(user)
+        return profile_schema.dump(user)
     except Exception:
         return server_error('Something went wrong, please try again.')
 
@@ -440,10 +380,35 @@ def change_email(user):
 @users.route('/logout', methods=['GET'])
 @authenticate
 def logout_user(user):
+    try:
+        denylist.revoke(g.token_payload)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        return server_error('Something went wrong, please try again.')
     return {'message': 'Successfully logged out.'}
 
 
 @users.route('', methods=['GET'])
+@read_replica
 @authenticate
 def get_user(user):
-    return UserSchema(exclude=['answers', 'sentences']).dump(user)
+    # The cached user, and so the ETag, is at most
+    # USER_CACHE_REFRESH_SECONDS behind another worker's change, see
+    # api.userchanges.
+    # private: the profile must not be stored by shared caches.
+    return conditional(f'user-{user.id}-{user.version}',
+                       lambda: profile_schema.dump(user),
+                       cache_control='private, no-cache')
+
+
+@users.route('/export', methods=['GET'])
+@admin_required
+def export_users(user):
+    names = request.args.getlist('table') or list(TABLES)
+
+    if any(name not in TABLES for name in names):
+        return bad_request(f"table must be one of {', '.join(TABLES)}")
+
+    rows = iter_ndjson(names, current_app.config['EXPORT_PAGE_SIZE'])
+    return Response(stream_with_context(rows), mimetype='application/x-ndjson')
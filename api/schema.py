@@ -1,7 +1,14 @@
 import re
-from marshmallow import Schema, fields, validate, ValidationError, validates, post_load
+from marshmallow import Schema, fields, validate, ValidationError, validates, validates_schema, post_load
+from api.catalog import catalog
 from api.models import Answer, Question, Sentence, User
 
+UNIQUE_ERRORS = {
+    'username': 'A user with that username already exists',
+    'email': 'A user with that email already exists'
+}
+
+
 class UserSchema(Schema):
     id = fields.Str(dump_only=True, validate=validate.Length(max=32))
     username = fields.Str(
@@ -26,13 +33,28 @@ class UserSchema(Schema):
             raise ValidationError(
                 'Username can only contain a-z, A-Z, 0-9, -, _ characters.'
             )
-        if User.find_by_username(username):
-            raise ValidationError('A user with that username already exists')
 
-    @validates('email')
-    def validate_email(self, email):
-        if User.find_by_email(email):
-            raise ValidationError('A user with that email already exists')
+    @validates('answers')
+    def validate_answers(self, answers):
+        # Answers are unique per (userId, questionId) in the database.
+        question_ids = [answer.questionId for answer in answers]
+        if len(set(question_ids)) != len(question_ids):
+            raise ValidationError('Answer each question only once.')
+
+        # An unknown id would fail the insert on the foreign key.
+        known = set(catalog.snapshot().ids)
+        unknown = [id for id in question_ids if id not in known]
+        if unknown:
+            raise ValidationError(
+                [f'Question {id} does not exist.' for id in unknown])
+
+    @validates_schema(skip_on_field_errors=False)
+    def validate_unique(self, data, **kwargs):
+        taken = User.find_taken(data.get('username'), data.get('email'))
+        errors = {field: [UNIQUE_ERRORS[field]] for field in taken}
+
+        if errors:
+            raise ValidationError(errors)
 
 
 class SentenceSchema(Schema):
@@ -62,4 +84,42 @@ class QuestionSchema(Schema):
 
     @post_load
     def make_question(self, data, **kwargs):
-        return Question(**data)
\ No newline at end of file
+        return Question(**data)
+
+
+class ValidateLoginSchema(Schema):
+    identity = fields.Str(required=True)
+    password = fields.Str(required=True)
+
+
+class LoginSchema(Schema):
+    userId = fields.Str(required=True)
+    questionId = fields.Str(required=True)
+    answer = fields.Str(required=True)
+
+
+class EmailSchema(Schema):
+    email = fields.Email(required=True)
+
+
+class EmailAnswerSchema(Schema):
+    email = fields.Email(required=True)
+    questionId = fields.Str(required=True)
+    answer = fields.Str(required=True)
+
+
+class TokenAnswerSchema(Schema):
+    token = fields.Str(required=True)
+    questionId = fields.Str(required=True)
+    answer = fields.Str(required=True)
+
+
+# Schemas are built once and shared between requests, they hold no
+# per-call state.
+user_schema = UserSchema()
+profile_schema = UserSchema(exclude=['answers', 'sentences'])
+validate_login_schema = ValidateLoginSchema()
+login_schema = LoginSchema()
+email_schema = EmailSchema()
+email_answer_schema = EmailAnswerSchema()
+token_answer_schema = TokenAnswerSchema()
@@ -0,0 +1,22 @@
+from api import db
+from api.models import Question
+
+QUESTIONS = [
+    "What was the happiest moment of your life",
+    "What was your first nickname"
+]
+
+
+def seed_questions():
+    """
+    Insert the QUESTIONS that are not in the questions table yet
+
+    :return int: Number of questions added
+    """
+    existing = {text for text, in db.session.query(Question.text)
+                .filter(Question.text.in_(QUESTIONS))}
+    missing = [text for text in QUESTIONS if text not in existing]
+
+    db.session.add_all([Question(text=text) for text in missing])
+    db.session.commit()
+    return len(missing)
@@ -0,0 +1,79 @@
+from collections import namedtuple
+from time import monotonic
+
+from flask import current_app
+
+from api import db
+from api.cache import user_cache
+from api.models import UserChange
+from api.replica import primary
+
+# Rows are re-read this far below the newest id seen, so a change whose
+# transaction commits after a later one is not skipped.
+OVERLAP = 100
+
+Snapshot = namedtuple('Snapshot', ['last_id', 'ids', 'checked_at'])
+
+
+class UserChangeLog(object):
+    """Keeps the process-local identity cache coherent with the other
+    workers.
+
+    Saving a user's profile or password adds a row to the user_change table
+    in the same transaction. Every ``USER_CACHE_REFRESH_SECONDS`` the
+    snapshot fetches the rows added since the last refresh and evicts their
+    users from the identity cache, so a change made by another worker
+    applies here within that delay instead of after ``USER_CACHE_TTL``.
+    ``ids`` holds the ids of the rows read within ``OVERLAP`` of
+    ``last_id``, so a row is only applied once.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_REFRESH_SECONDS', 2)
+        app.extensions['user_changes'] = None
+
+    def _refresh(self, snapshot, now):
+        query = db.session.query(UserChange.id, UserChange.userId)
+
+        if snapshot is None:
+            snapshot = Snapshot(0, frozenset(), now)
+        else:
+            query = query.filter(UserChange.id > snapshot.last_id - OVERLAP)
+
+        # A replica could still miss a change the primary has.
+        with primary():
+            rows = query.order_by(UserChange.id).all()
+
+        new = [row for row in rows if row.id not in snapshot.ids]
+        if not new:
+            return snapshot._replace(checked_at=now)
+
+        cache = user_cache()
+        for row in new:
+            cache.pop(row.userId)
+
+        last_id = max(snapshot.last_id, rows[-1].id)
+        ids = frozenset(row.id for row in rows if row.id > last_id - OVERLAP)
+        return Snapshot(last_id, ids, now)
+
+    def sync(self):
+        """
+        Evict the users changed by other workers from the identity cache,
+        at most every ``USER_CACHE_REFRESH_SECONDS``
+        """
+        app = current_app._get_current_object()
+        snapshot = app.extensions.get('user_changes')
+        now = monotonic()
+
+        if snapshot is not None and now - snapshot.checked_at < \
+                app.config['USER_CACHE_REFRESH_SECONDS']:
+            return
+
+        app.extensions['user_changes'] = self._refresh(snapshot, now)
+
+
+user_changes = UserChangeLog()
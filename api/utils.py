@@ -1,15 +1,26 @@
+import json
 import random
+import re
+from collections import namedtuple
 from functools import wraps
-from time import sleep
+from hashlib import sha256
 
-from flask import request, current_app
-from api.errors import error_response
+from flask import g, make_response, request, current_app
+from marshmallow import ValidationError
+from api import db
+from api.errors import error_response, server_error
 from api.models import User
-from api.email import send_password_email
+from api.cache import sentence_cache
+from api.denylist import denylist
+from api.userchanges import user_changes
+from api.replica import primary, reading_replica
 
 
 special_chars = ['~', '@', '#', '$', '%', '^', '&', '*', '/', '-', '+', ';', '?', '{', '}', '(', ')', '[', ']', '|', '_', '=']
 numbers = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '0']
+word_pattern = re.compile(r'\w+')
+
+SentenceAnalysis = namedtuple('SentenceAnalysis', ['word_counts', 'pools'])
 
 def authenticate(func):
     @wraps(func)
@@ -25,7 +36,18 @@ def authenticate(func):
         if not isinstance(payload, dict):
             return error_response(401, message=payload)
 
-        user = User.find_by_id(payload.get('id'))
+        if denylist.is_revoked(payload):
+            return error_response(401, message='Token revoked. Please log in again.')
+
+        # The claims, for views that act on the token itself, e.g. logout.
+        g.token_payload = payload
+        user_changes.sync()
+        user = User.find_by_id_cached(payload.get('id'))
+
+        if user is None and reading_replica():
+            # The replica may not have caught up with a recent signup.
+            with primary():
+                user = User.find_by_id_cached(payload.get('id'))
 
         if user is None:
             return error_response(401, message='Invalid token.')
@@ -34,60 +56,184 @@ def authenticate(func):
     return wrapper
 
 
-def generate_password(sentences):
-    """Generate an alpha-numeric-char string from the given sentences 
+def admin_required(func):
+    """Like authenticate, but only lets the users in ADMIN_EMAILS through"""
+    @wraps(func)
+    @authenticate
+    def wrapper(user, *args, **kwargs):
+        # The identity cache may hold an email another worker has since
+        # changed, admin access is decided on the database's.
+        with primary():
+            email = db.session.query(User.email).filter(
+                User.id == user.id).scalar()
+
+        if email not in current_app.config['ADMIN_EMAILS']:
+            return error_response(403, message='Admin only.')
+
+        return func(user, *args, **kwargs)
+    return wrapper
+
+
+def conditional(etag, render, cache_control='no-cache'):
+    """Answer a GET with a strong ETag, or a 304 if the client has it
+
+    ``render`` is only called when the client's If-None-Match does not match
+    ``etag``, so an unchanged resource is not serialized.
 
     Args:
-        sentences (list): An array of sentences
+        etag (str): Strong ETag of the representation, without quotes
+        render (callable): Returns the response body, e.g. a dict
+        cache_control (str): The Cache-Control header
 
     Returns:
-        string: A password string
+        Response: 200 with the body, or 304 without one
     """
-    chars = special_chars + numbers
-    words = []
-    count = 0
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def verify_answer(question_id, answer, incorrect_message, id=None,
+                  email=None, unknown_user_message='User does not exist.',
+                  options=()):
+    """Check a user's answer to a challenge question in a single query
+
+    Args:
+        question_id (str): The question's id
+        answer (str): The answer to check
+        incorrect_message (str): Error message for a wrong answer
+        id (str): The user's id
+        email (str): The user's email, used when there is no id
+        unknown_user_message (str): Error message for a missing user
+        options (tuple): Loader options for the user, e.g. the relationships
+            the caller needs
+
+    Returns:
+        tuple: The user and None, or None and an error response
+    """
+    try:
+        user, question_id, answer_text = User.find_with_answer(
+            question_id, id=id, email=email, options=options)
+    except Exception:
+        return None, server_error('Something went wrong, please try again.')
 
+    if user is None:
+        return None, error_response(401, unknown_user_message)
+
+    if question_id is None:
+        return None, error_response(401, 'That question does not exist.')
+
+    if answer_text is None or answer_text != answer:
+        return None, error_response(401, incorrect_message)
+    return user, None
+
+
+def tokenize(sentences):
+    """Split each sentence into the words a password can be made of
+
+    Args:
+        sentences (list): An array of sentences
+
+    Raises:
+        ValueError: If a sentence has no word longer than one character
+
+    Returns:
+        list: A list of word pools, one per sentence
+    """
+    pools = []
     for sentence in sentences:
-        word = ''
-        while not len(word) > 1:
-            word = random.choice(sentence.split()).strip()
+        pool = [word for word in sentence.split() if len(word) > 1]
+        if not pool:
+            raise ValueError(
+                'Every sentence needs a word longer than one character')
+        pools.append(tuple(pool))
+    return tuple(pools)
+
+
+def analyze_sentences(sentences):
+    """Validate the sentences and split them into word pools
+
+    The analysis is cached under a hash of the sentences, so checking the
+    same sentences again (e.g. /validate and then /passwords) is free.
+
+    Args:
+        sentences (list): An array of sentences
+
+    Raises:
+        ValidationError: If a sentence is not between 5 and 10 words
+        ValueError: If a sentence has no word longer than one character
+
+    Returns:
+        SentenceAnalysis: The word count and word pool of every sentence
+    """
+    # JSON keeps the sentence boundaries, a separator could appear in one.
+    key = sha256(json.dumps(sentences).encode()).digest()
+    cache = sentence_cache()
+    analysis = cache.get(key)
+
+    if analysis is not None:
+        return analysis
 
-        words.append(word)
-        count += len(word)
+    word_counts = tuple(len(word_pattern.findall(sentence))
+                        for sentence in sentences)
+    if any(count > 10 or count < 5 for count in word_counts):
+        raise ValidationError(
+            'All the sentences must be between 5 and 10 words')
 
-    chars = random.sample(special_chars + numbers, 5) if count >= 10 else \
-        random.sample(special_chars + numbers, 10)
-    sample = words + chars
-    random.shuffle(sample)
-    return ''.join(sample)
+    analysis = SentenceAnalysis(word_counts, tokenize(sentences))
+    cache.set(key, analysis)
+    return analysis
+
+
+def generate_password(sentences):
+    """Generate an alpha-numeric-char string from the given sentences 
+
+    Args:
+        sentences (list): An array of sentences
+
+    Returns:
+        string: A password string
+    """
+    return generate_passwords(sentences, 1)[0]
 
 
 def generate_passwords(sentences, n):
-    """Generate a list of passwords by calling generate_password() n times
+    """Generate a list of passwords from the given sentences
 
     Args:
         sentences (list): An array of sentences
-        n (list): Number of times to call generate_password()
+        n (int): Number of passwords to generate
 
     Returns:
         list: A list of password strings
     """
-    return [generate_password(sentences) for i in range(n)]
+    return draw_passwords(tokenize(sentences), n)
 
 
-def password_reminder(app, user):
-    """Send the user an email periodically with a link to view their password 
+def draw_passwords(pools, n):
+    """Generate a list of passwords from tokenized sentences
+
+    The words of all the passwords are drawn in a single pass, so the cost
+    grows linearly with n.
 
     Args:
-        user (User): The user object
+        pools (list): The word pool of every sentence, see tokenize()
+        n (int): Number of passwords to generate
 
     Returns:
-        None
+        list: A list of password strings
     """
-    # run forever
-    while True:
-        # block for the interval
-        sleep(user.password_reminder * 24 * 60 * 60)
-        with app.app_context():
-            # perform the task
-            send_password_email(user, reset=True)
+    chars = special_chars + numbers
+    columns = [random.choices(pool, k=n) for pool in pools]
+    passwords = []
+
+    for words in zip(*columns):
+        count = sum(len(word) for word in words)
+        sample = list(words) + random.sample(chars, 5 if count >= 10 else 10)
+        random.shuffle(sample)
+        passwords.append(''.join(sample))
+    return passwords
@@ -1,11 +1,12 @@
 from api import create_app, cli, db
-from api.models import Answer, Question, Sentence, User
 
 app = create_app()
 cli.register(app)
 
 @app.shell_context_processor
 def make_shell_context():
+    from api.models import Answer, Question, Sentence, User
+
     return {
         'db': db,
         'User': User,
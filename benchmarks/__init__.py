@@ -0,0 +1,130 @@
+"""Shared helpers for the benchmark scripts.
+
+Run a benchmark from the project root, e.g.::
+
+    python -m benchmarks.question_catalog
+"""
+import os
+import statistics
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_TO_STDOUT', '1')
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from api import create_app, db  # noqa: E402
+from api.seed import seed_questions  # noqa: E402
+from config import Config  # noqa: E402
+
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog",
+    "Every good boy deserves fruit and some more",
+    "Curiosity killed the cat but satisfaction brought it back"
+]
+PASSWORD = 'password'
+
+
+def make_app(database_uri=None, **options):
+    """
+    Create an app backed by a fresh database
+
+    :param database_uri: Defaults to a temporary SQLite file
+    :param options: Extra config values
+    :return Flask: The app, with its tables created and questions seeded
+    """
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='cmp-bench-')
+        os.close(fd)
+        database_uri = 'sqlite:///' + path
+
+    options.setdefault('SQLALCHEMY_DATABASE_URI', database_uri)
+    options.setdefault('TESTING', True)
+    options.setdefault('PASSWORD_HASH_WORK_FACTOR', 1)
+    options.setdefault('PASSWORD_HASH_WORKERS', 0)
+    options.setdefault('PASSWORD_HASH_CONCURRENCY', 0)
+    options.setdefault('RATE_LIMIT_ENABLED', False)
+    options.setdefault('WEB_CLIENT_BASE_URL', 'http://localhost:3000')
+    options.setdefault('DOMAIN_NAME', 'example')
+    config_class = type('BenchConfig', (Config,), options)
+
+    app = create_app(config_class)
+    with app.app_context():
+        db.create_all()
+        seed_questions()
+    return app
+
+
+def seed_users(app, count, password_hash=None):
+    """
+    Insert ``count`` users, each with an answer to every question and the
+    three SENTENCES. The answer to question ``q`` is ``'answer q'``.
+
+    The password is hashed once with a single PBKDF2 iteration unless a hash
+    is given, so that benchmarks measure the request path rather than the
+    key derivation. Rows are written with executemany, the user table must
+    be empty.
+
+    :return list: The usernames, user ``i + 1`` is ``usernames[i]``
+    """
+    from api.models import Answer, Question, Sentence, User
+
+    password_hash = password_hash or \
+        generate_password_hash(PASSWORD, method='pbkdf2:sha256:1')
+    now = datetime.utcnow()
+    usernames = [f'user_{i}' for i in range(count)]
+
+    with app.app_context():
+        question_ids = [question.id for question in Question.query.all()]
+        db.session.execute(User.__table__.insert(), [
+            {'id': i + 1, 'username': username,
+             'email': f'{username}@example.com', 'password': password_hash,
+             'password_reminder': 7, 'created_on': now}
+            for i, username in enumerate(usernames)])
+        db.session.execute(Answer.__table__.insert(), [
+            {'text': f'answer {question_id}', 'userId': i,
+             'questionId': question_id}
+            for i in range(1, count + 1) for question_id in question_ids])
+        db.session.execute(Sentence.__table__.insert(), [
+            {'text': sentence, 'userId': i, 'createdOn': now}
+            for i in range(1, count + 1) for sentence in SENTENCES])
+        db.session.commit()
+    return usernames
+
+
+def measure(func, iterations):
+    """
+    Call ``func`` ``iterations`` times
+
+    :return dict: Latency stats in milliseconds
+    """
+    samples = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func()
+        samples.append((perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    count = len(samples)
+
+    def percentile(p):
+        return samples[min(count - 1, int(round(p / 100 * (count - 1))))]
+
+    return {
+        'count': count,
+        'mean': statistics.fmean(samples),
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'p99': percentile(99),
+    }
+
+
+def report(name, stats):
+    print(f"{name:<32} n={stats['count']:<6} mean={stats['mean']:8.3f}ms "
+          f"p50={stats['p50']:8.3f}ms p95={stats['p95']:8.3f}ms "
+          f"p99={stats['p99']:8.3f}ms")
@@ -0,0 +1,83 @@
+"""Query plans and latency of the answer/sentence lookups without and with
+the foreign key indexes added in revision 5f0b93d7e1a2.
+
+    python -m benchmarks.answer_indexes [users] [iterations]
+
+Set BENCH_DATABASE_URL to run against Postgres instead of a temporary
+SQLite file.
+"""
+import os
+import random
+import sys
+
+from sqlalchemy import text
+
+from benchmarks import make_app, measure, report, seed_users
+from api import db
+from api.models import Answer, Question, Sentence, User
+
+INDEXES = [
+    Answer.__table__.indexes,
+    Sentence.__table__.indexes,
+]
+
+
+def explain(sql):
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' \
+        else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql)).fetchall()
+    return '\n'.join('    ' + ' '.join(str(col) for col in row)
+                     for row in rows)
+
+
+def lookups(count):
+    def find_with_answer():
+        User.find_with_answer('1', id=random.randint(1, count))
+        db.session.rollback()
+
+    def user_sentences():
+        db.session.query(Sentence.text).filter(
+            Sentence.userId == random.randint(1, count)).all()
+        db.session.rollback()
+
+    return [('find_with_answer', find_with_answer),
+            ('user sentences', user_sentences)]
+
+
+def run(count=5000, iterations=500):
+    database_uri = os.environ.get('BENCH_DATABASE_URL')
+    app = make_app(database_uri)
+    seed_users(app, count)
+
+    with app.app_context():
+        answer_sql = str(
+            db.session.query(User.id, Question.id, Answer.text)
+            .select_from(User)
+            .outerjoin(Question, Question.id == 1)
+            .outerjoin(Answer, db.and_(Answer.userId == User.id,
+                                       Answer.questionId == Question.id))
+            .filter(User.id == count)
+            .statement.compile(compile_kwargs={'literal_binds': True}))
+        sentence_sql = f'SELECT text FROM sentence WHERE "userId" = {count}'
+
+        for indexes in INDEXES:
+            for index in indexes:
+                index.drop(db.engine)
+
+        for label in ('without indexes', 'with indexes'):
+            if label == 'with indexes':
+                for indexes in INDEXES:
+                    for index in indexes:
+                        index.create(db.engine)
+
+            print(f'-- {label}')
+            print('  answer lookup plan:')
+            print(explain(answer_sql))
+            print('  sentence lookup plan:')
+            print(explain(sentence_sql))
+            for name, func in lookups(count):
+                report(f'{name} ({label})', measure(func, iterations))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
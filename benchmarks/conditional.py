@@ -0,0 +1,58 @@
+"""Bandwidth and latency of conditional GETs.
+
+Times ``GET /api/users`` and ``GET /api/users/question`` without a
+validator and with the ETag of the previous response in If-None-Match,
+and prints the bytes of each response. The question is drawn at random,
+so only the requests that draw the client's question get a 304.
+
+    python -m benchmarks.conditional [iterations]
+"""
+import sys
+
+from benchmarks import make_app, measure, report, seed_users
+
+
+def response_size(response):
+    headers = sum(len(name) + len(value) + 4 for name, value in
+                  response.headers.to_wsgi_list())
+    return headers, len(response.get_data())
+
+
+def run(iterations=2000):
+    app = make_app()
+    seed_users(app, 1)
+
+    with app.app_context():
+        from api.models import User
+        token = User.query.get(1).encode_auth_token()
+
+    client = app.test_client()
+    auth = {'Authorization': f'Bearer {token}'}
+
+    for path, headers in (('/api/users', auth), ('/api/users/question', {})):
+        etag = client.get(path, headers=headers).headers['ETag']
+        conditional = dict(headers, **{'If-None-Match': etag})
+        statuses = []
+
+        def get():
+            client.get(path, headers=headers)
+
+        def revalidate():
+            statuses.append(client.get(path, headers=conditional).status_code)
+
+        measure(get, iterations // 10)  # warm up
+
+        report(f'GET {path}', measure(get, iterations))
+        report(f'GET {path} 304', measure(revalidate, iterations))
+
+        full = response_size(client.get(path, headers=headers))
+        hits = [response_size(client.get(path, headers=conditional))
+                for _ in range(20)]
+        not_modified = min(hits, key=sum)
+        print(f'  200: {full[0]} header + {full[1]} body bytes, '
+              f'304: {not_modified[0]} header + {not_modified[1]} body bytes, '
+              f'{statuses.count(304) / len(statuses):.0%} not modified')
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
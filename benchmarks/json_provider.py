@@ -0,0 +1,70 @@
+"""JSON encoding and decoding cost per JSON_PROVIDER on the API's payloads.
+
+Encodes the get_user, /api/sentences/validate and 422 signup responses and
+decodes the signup request body with ``flask.json``, the path ``jsonify``
+and ``request.get_json()`` take, then times ``GET /api/users`` end to end.
+
+    python -m benchmarks.json_provider [iterations]
+"""
+import sys
+from datetime import datetime
+
+from flask import json
+
+from benchmarks import PASSWORD, SENTENCES, make_app, measure, report, seed_users
+from api.fastjson import PROVIDERS
+
+
+def run(iterations=20000):
+    app = make_app()
+    seed_users(app, 1)
+
+    with app.app_context():
+        from api.models import User
+        from api.schema import profile_schema, user_schema
+        from api.utils import analyze_sentences, draw_passwords
+        from api.catalog import catalog
+
+        user = User.query.get(1)
+        token = user.encode_auth_token()
+        pools = analyze_sentences(SENTENCES).pools
+        signup = {
+            'username': 'user_1', 'email': 'user_1@example.com',
+            'password': PASSWORD, 'password_reminder': 7,
+            'country': 'Nigeria', 'age': '25-34', 'sex': 'female',
+            'answers': [{'text': 'answer 1', 'questionId': '1'},
+                        {'text': 'answer 2', 'questionId': '2'}],
+            'sentences': [{'text': sentence} for sentence in SENTENCES]}
+        payloads = {
+            'get_user': profile_schema.dump(user),
+            'validate': {'passwords': draw_passwords(pools, 50),
+                         'questions': catalog.all()},
+            'signup 422': {'error': 'Unprocessable Entity',
+                           'message': user_schema.validate({})},
+            'created_on': {'created_on': datetime.utcnow()},
+        }
+    body = json.dumps(signup, app=app)
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def get_user():
+        client.get('/api/users', headers=headers)
+
+    measure(get_user, iterations // 10)  # warm up
+
+    for name, (encoder, decoder) in PROVIDERS.items():
+        app.json_encoder, app.json_decoder = encoder, decoder
+
+        with app.test_request_context():
+            for payload_name, payload in payloads.items():
+                report(f'{name} dumps {payload_name}',
+                       measure(lambda: json.dumps(payload), iterations))
+            report(f'{name} loads signup',
+                   measure(lambda: json.loads(body), iterations))
+            print(f'{name} created_on: {json.dumps(payloads["created_on"])}')
+
+        report(f'{name} GET /api/users', measure(get_user, iterations // 10))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,319 @@
+"""End-to-end load test of the main API flows.
+
+Boots the app in a threaded WSGI server against a seeded database, points
+MAIL_SERVER at a local stub, and drives these flows from concurrent
+clients:
+
+* signup: ``POST /api/users``
+* login: ``POST /api/users/validate-login`` then ``POST /api/users/login``
+* forgot password: ``POST /api/users/forgot-password``
+* view password: ``POST /api/users/get-password``
+* profile: ``GET /api/users``
+
+The emails queued by the run are then delivered to the stub by the outbox.
+
+Throughput and p50/p95/p99 latency per endpoint are printed and saved as
+JSON, so runs can be compared across commits::
+
+    python -m benchmarks.load --users 1000 --concurrency 8 --requests 200
+    python -m benchmarks.load --compare bench_results/old.json new.json
+
+Set BENCH_DATABASE_URL to run against Postgres instead of a temporary
+SQLite file. The database must be empty.
+
+With ``--url`` the clients drive an already running server instead, e.g.
+gunicorn, which must use BENCH_DATABASE_URL as its DATABASE_URL and the
+same SECRET_KEY, and run with RATE_LIMIT_ENABLED=false. Its tables are created and seeded by this script.
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import cycle
+from time import perf_counter
+
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks import PASSWORD, SENTENCES, make_app, seed_users, summarize
+
+
+class MailStub(BaseHTTPRequestHandler):
+    """Accepts every email like the Mailgun API would"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{"message": "Queued. Thank you."}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+class Recorder(object):
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def request(self, session, method, endpoint, url, **kwargs):
+        start = perf_counter()
+        response = session.request(method, url, **kwargs)
+        elapsed = (perf_counter() - start) * 1000
+
+        with self.lock:
+            self.samples[endpoint].append(elapsed)
+            self.statuses[endpoint][response.status_code] += 1
+        return response
+
+
+class Flows(object):
+    """The client flows, each one is a function of a requests session"""
+
+    def __init__(self, base_url, recorder, login_users, reset_users,
+                 reset_tokens):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.login_users = cycle(login_users)
+        self.reset_users = cycle(reset_users)
+        self.reset_tokens = cycle(reset_tokens)
+        self.signups = iter(range(10 ** 9))
+        self.lock = threading.Lock()
+
+    def next(self, iterator):
+        with self.lock:
+            return next(iterator)
+
+    def call(self, session, method, path, **kwargs):
+        endpoint = f'{method} {path}'
+        return self.recorder.request(session, method, endpoint,
+                                     self.base_url + path, **kwargs)
+
+    def signup(self, session):
+        name = f'load_{os.getpid()}_{self.next(self.signups)}'
+        self.call(session, 'POST', '/api/users', json={
+            'username': name, 'email': f'{name}@example.com',
+            'password': PASSWORD, 'password_reminder': 7,
+            'answers': [{'text': 'answer 1', 'questionId': '1'},
+                        {'text': 'answer 2', 'questionId': '2'}],
+            'sentences': [{'text': sentence} for sentence in SENTENCES]})
+
+    def login(self, session):
+        username = self.next(self.login_users)
+        response = self.call(session, 'POST', '/api/users/validate-login',
+                             json={'identity': username, 'password': PASSWORD})
+        if response.status_code != 200:
+            return None
+
+        body = response.json()
+        question_id = body['question']['id']
+        response = self.call(session, 'POST', '/api/users/login', json={
+            'userId': str(body['userId']), 'questionId': question_id,
+            'answer': f'answer {question_id}'})
+        return response.json().get('token') if response.ok else None
+
+    def forgot_password(self, session):
+        username = self.next(self.reset_users)
+        self.call(session, 'POST', '/api/users/forgot-password', json={
+            'email': f'{username}@example.com', 'questionId': '1',
+            'answer': 'answer 1'})
+
+    def view_password(self, session):
+        self.call(session, 'POST', '/api/users/get-password', json={
+            'token': self.next(self.reset_tokens), 'questionId': '1',
+            'answer': 'answer 1'})
+
+    def profile(self, session, token):
+        self.call(session, 'GET', '/api/users',
+                  headers={'Authorization': f'Bearer {token}'})
+
+    def client(self, requests_per_client):
+        """One client: logs in, then cycles through the flows"""
+        session = requests.Session()
+        token = None
+        flows = cycle(['login', 'profile', 'profile', 'view_password',
+                       'forgot_password', 'signup'])
+
+        for _ in range(requests_per_client):
+            flow = next(flows)
+            if flow == 'login' or token is None:
+                token = self.login(session)
+            elif flow == 'profile':
+                self.profile(session, token)
+            else:
+                getattr(self, flow)(session)
+        session.close()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(users=1000, concurrency=8, requests_per_client=200, work_factor=1,
+        output=None, url=None, **config):
+    mail_server = serve(ThreadingHTTPServer(('127.0.0.1', 0), MailStub))
+    app = make_app(
+        os.environ.get('BENCH_DATABASE_URL'),
+        MAIL_SERVER=f'http://127.0.0.1:{mail_server.server_port}/messages',
+        PASSWORD_HASH_WORK_FACTOR=work_factor,
+        **config)
+    usernames = seed_users(app, users, generate_password_hash(
+        PASSWORD, f'pbkdf2:sha256:{work_factor}'))
+
+    # forgot-password revokes every token of the users it resets, so the
+    # reset links opened with get-password belong to the other users.
+    login_users, reset_users = usernames[::2], usernames[1::2]
+
+    with app.app_context():
+        from api.models import User
+
+        reset_tokens = [
+            user.encode_auth_token(password=PASSWORD, reset_password=True)
+            for user in User.query.filter(
+                User.username.in_(login_users[:100]))]
+
+    http_server = None
+    if url is None:
+        http_server = serve(make_server('127.0.0.1', 0, app, threaded=True,
+                                        request_handler=QuietHandler))
+        url = f'http://127.0.0.1:{http_server.server_port}'
+    recorder = Recorder()
+    flows = Flows(url.rstrip('/'), recorder, login_users, reset_users,
+                  reset_tokens)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(flows.client, requests_per_client)
+                       for _ in range(concurrency)]:
+            future.result()
+    duration = perf_counter() - start
+
+    if http_server is not None:
+        http_server.shutdown()
+
+    # Deliver the queued emails to the stub, like `flask outbox run` would.
+    with app.app_context():
+        from api import outbox
+
+        outbox_start = perf_counter()
+        sent, failed = outbox.run(once=True)
+        outbox_duration = perf_counter() - outbox_start
+    mail_server.shutdown()
+
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        endpoints[endpoint] = dict(
+            summarize(samples),
+            throughput=len(samples) / duration,
+            statuses={str(status): count for status, count
+                      in recorder.statuses[endpoint].items()})
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'users': users,
+        'concurrency': concurrency,
+        'requests_per_client': requests_per_client,
+        'work_factor': work_factor,
+        'url': url if http_server is None else None,
+        'duration': duration,
+        'throughput': sum(len(s) for s in recorder.samples.values()) / duration,
+        'endpoints': endpoints,
+        'outbox': {'sent': sent, 'failed': failed,
+                   'throughput': sent / outbox_duration},
+    }
+    print_results(results)
+
+    output = output or os.path.join(
+        'bench_results',
+        f"load-{results['commit'] or 'unknown'}-{datetime.utcnow():%Y%m%d%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Saved to {output}')
+    return results
+
+
+def print_results(results):
+    print(f"commit={results['commit']} users={results['users']} "
+          f"concurrency={results['concurrency']} "
+          f"throughput={results['throughput']:.1f} req/s")
+    outbox = results['outbox']
+    print(f"outbox sent={outbox['sent']} failed={outbox['failed']} "
+          f"{outbox['throughput']:.1f} emails/s")
+    for endpoint, stats in results['endpoints'].items():
+        print(f"{endpoint:<36} n={stats['count']:<6} "
+              f"{stats['throughput']:7.1f} req/s p50={stats['p50']:8.2f}ms "
+              f"p95={stats['p95']:8.2f}ms p99={stats['p99']:8.2f}ms "
+              f"{stats['statuses']}")
+
+
+def compare(before_path, after_path):
+    """Print the p50/p95/p99 change of every endpoint between two runs"""
+    with open(before_path) as file:
+        before = json.load(file)
+    with open(after_path) as file:
+        after = json.load(file)
+
+    print(f"{before['commit']} -> {after['commit']}")
+    for endpoint, stats in after['endpoints'].items():
+        old = before['endpoints'].get(endpoint)
+        if old is None:
+            continue
+        changes = ' '.join(
+            f"{key}={stats[key]:.2f}ms ({(stats[key] / old[key] - 1) * 100:+.0f}%)"
+            for key in ('p50', 'p95', 'p99'))
+        print(f'{endpoint:<36} {changes}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=1000,
+                        help='Users seeded before the run')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=200,
+                        dest='requests_per_client',
+                        help='Requests made by each client')
+    parser.add_argument('--work-factor', type=int, default=1,
+                        help='PBKDF2 iterations of new password hashes')
+    parser.add_argument('--output', help='Where the JSON results are saved')
+    parser.add_argument('--url', help='Drive this server instead of an '
+                                      'in-process one')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two saved runs instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    run(args.users, args.concurrency, args.requests_per_client,
+        args.work_factor, args.output, args.url)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Password candidate generation, per-password loop vs batched engine.
+
+    python -m benchmarks.passwords [iterations]
+"""
+import random
+import sys
+
+from benchmarks import SENTENCES, measure, report
+from api.utils import generate_passwords, numbers, special_chars
+
+
+def legacy_generate_password(sentences):
+    """The implementation generate_passwords() used to call n times"""
+    words = []
+    count = 0
+
+    for sentence in sentences:
+        word = ''
+        while not len(word) > 1:
+            word = random.choice(sentence.split()).strip()
+
+        words.append(word)
+        count += len(word)
+
+    chars = random.sample(special_chars + numbers, 5) if count >= 10 else \
+        random.sample(special_chars + numbers, 10)
+    sample = words + chars
+    random.shuffle(sample)
+    return ''.join(sample)
+
+
+def run(iterations=200):
+    for count in (3, 50, 500, 5000):
+        before = measure(lambda: [legacy_generate_password(SENTENCES)
+                                  for _ in range(count)], iterations)
+        after = measure(lambda: generate_passwords(SENTENCES, count),
+                        iterations)
+        report(f'count={count} legacy', before)
+        report(f'count={count} batched', after)
+        print(f'count={count} speedup {before["mean"] / after["mean"]:.2f}x')
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,36 @@
+"""Login-path latency with the question catalog cache on and off.
+
+Drives ``POST /api/users/validate-login`` (which picks a random question)
+and ``GET /api/users/question`` through the test client.
+
+    python -m benchmarks.question_catalog [iterations]
+"""
+import sys
+
+from benchmarks import PASSWORD, make_app, measure, report, seed_users
+
+
+def run(iterations=2000):
+    for enabled in (False, True):
+        app = make_app(QUESTION_CATALOG_CACHE=enabled)
+        username = seed_users(app, 1)[0]
+        client = app.test_client()
+        label = 'on' if enabled else 'off'
+
+        def validate_login():
+            response = client.post('/api/users/validate-login', json={
+                'identity': username, 'password': PASSWORD})
+            assert response.status_code == 200, response.get_json()
+
+        def get_question():
+            response = client.get('/api/users/question')
+            assert response.status_code == 200, response.get_json()
+
+        validate_login()
+        report(f'validate-login cache={label}',
+               measure(validate_login, iterations))
+        report(f'question cache={label}', measure(get_question, iterations))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
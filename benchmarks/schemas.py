@@ -0,0 +1,58 @@
+"""Per-request cost of building schemas on every call vs the shared ones.
+
+Compares ``Schema.from_dict(...)().load()`` and ``UserSchema(exclude=...)``
+against the instances in ``api.schema`` for the validate-login, login and
+get_user payloads.
+
+    python -m benchmarks.schemas [iterations]
+"""
+import sys
+from datetime import datetime
+
+from marshmallow import Schema, fields
+
+from benchmarks import measure, report
+from api.models import User
+from api.schema import UserSchema, login_schema, profile_schema, \
+    validate_login_schema
+
+
+def run(iterations=20000):
+    validate_login_body = {'identity': 'user_0', 'password': 'password'}
+    login_body = {'userId': '1', 'questionId': '1', 'answer': 'answer 1'}
+    user = User(id=1, username='user_0', email='user_0@example.com',
+                password_reminder=7, created_on=datetime.utcnow())
+
+    def validate_login_per_call():
+        Schema.from_dict({
+            "identity": fields.Str(required=True),
+            "password": fields.Str(required=True),
+        })().load(validate_login_body)
+
+    def login_per_call():
+        Schema.from_dict({
+            "userId": fields.Str(required=True),
+            "questionId": fields.Str(required=True),
+            "answer": fields.Str(required=True)
+        })().load(login_body)
+
+    def get_user_per_call():
+        UserSchema(exclude=['answers', 'sentences']).dump(user)
+
+    cases = [
+        ('validate-login', validate_login_per_call,
+         lambda: validate_login_schema.load(validate_login_body)),
+        ('login', login_per_call, lambda: login_schema.load(login_body)),
+        ('get_user', get_user_per_call, lambda: profile_schema.dump(user)),
+    ]
+    for name, per_call, shared in cases:
+        before = measure(per_call, iterations)
+        after = measure(shared, iterations)
+        report(f'{name} per call', before)
+        report(f'{name} shared', after)
+        print(f'{name} saves {(before["mean"] - after["mean"]) * 1000:.1f}us '
+              f'per request')
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
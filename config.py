@@ -5,20 +5,137 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
 
+def database_url(name, default=None):
+    url = os.environ.get(name) or default
+    return url and url.replace('postgres://', 'postgresql://', 1)
+
+
+def engine_options(url):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from the DATABASE_* variables
+
+    SQLite keeps SQLAlchemy's default pool, which takes no sizing options.
+    On Postgres every connection gets a statement_timeout, so a slow query
+    is cancelled instead of pinning a worker.
+    """
+    options = {'pool_pre_ping': os.environ.get(
+        'DATABASE_POOL_PRE_PING', 'true').lower() == 'true'}
+
+    if url.startswith('sqlite'):
+        return options
+
+    options.update(
+        pool_size=int(os.environ.get('DATABASE_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DATABASE_MAX_OVERFLOW', 10)),
+        pool_timeout=int(os.environ.get('DATABASE_POOL_TIMEOUT', 30)),
+        pool_recycle=int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)))
+
+    statement_timeout = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT_MS', 30000))
+    if statement_timeout and url.startswith('postgresql'):
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
 class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'an-extremely-long-key'
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
+    # logging: JSON lines, to stdout or to LOG_FILE rotated every
+    # LOG_ROTATE_WHEN (e.g. 'midnight') if it is set, else every LOG_MAX_BYTES
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_REQUESTS = os.environ.get('LOG_REQUESTS', 'true').lower() == 'true'
+    LOG_FILE = os.environ.get('LOG_FILE', 'logs/cmp.log')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_ROTATE_WHEN = os.environ.get('LOG_ROTATE_WHEN')
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+    ADMIN_EMAILS = [email.strip() for email in
+                    os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()]
+    # json: 'orjson', or 'stdlib' for the json module
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
     # sqlalchemy
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL').replace(
-        'postgres://', 'postgresql://') or \
-        'sqlite:///' + os.path.join(basedir, 'app.db')
+    SQLALCHEMY_DATABASE_URI = database_url(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'app.db'))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # reads of the @read_replica views go to this bind when it is set
+    SQLALCHEMY_BINDS = {'replica': database_url('DATABASE_REPLICA_URL')} \
+        if os.environ.get('DATABASE_REPLICA_URL') else None
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # token
     TOKEN_EXPIRATION_DAYS = 3
     TOKEN_EXPIRATION_SECONDS = 0
     PASSWORD_TOKEN_EXPIRATION_HRS = 60 * 60
+    # seconds before a worker sees a token revoked by another one
+    TOKEN_DENYLIST_REFRESH_SECONDS = int(
+        os.environ.get('TOKEN_DENYLIST_REFRESH_SECONDS', 2))
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 4096))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 4096))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    # seconds before a worker evicts a user changed by another one
+    USER_CACHE_REFRESH_SECONDS = int(
+        os.environ.get('USER_CACHE_REFRESH_SECONDS', 2))
+    # profiling of sampled requests and of those with a signed X-Profile
+    # header, see `flask profile token`
+    PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', 'false').lower() == 'true'
+    PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_SECRET = os.environ.get('PROFILE_SECRET')
+    PROFILE_INTERVAL_MS = int(os.environ.get('PROFILE_INTERVAL_MS', 1))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+    # metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = int(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    # /api/metrics needs METRICS_TOKEN, without one it is forbidden unless
+    # METRICS_PUBLIC is set
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', 'false').lower() == 'true'
+    # password hashing: 'pbkdf2' or 'scrypt', a work factor of 0 is the
+    # hasher's default, 260000 iterations or an N of 32768
+    PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'sha256')
+    PASSWORD_HASH_WORK_FACTOR = int(
+        os.environ.get('PASSWORD_HASH_WORK_FACTOR', 0))
+    PASSWORD_HASH_WORKERS = int(
+        os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    PASSWORD_HASH_CONCURRENCY = int(
+        os.environ.get('PASSWORD_HASH_CONCURRENCY', max(2, os.cpu_count() or 1)))
+    # rate limiting of the credential endpoints, per IP and per identity
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    # behind a proxy, every client has the proxy's IP until TRUSTED_PROXIES
+    # is set, so the IP bucket is off by default without it
+    RATE_LIMIT_IP_ENABLED = os.environ.get(
+        'RATE_LIMIT_IP_ENABLED',
+        'true' if TRUSTED_PROXIES else 'false').lower() == 'true'
+    RATE_LIMIT_IP_REQUESTS = int(os.environ.get('RATE_LIMIT_IP_REQUESTS', 30))
+    RATE_LIMIT_IP_SECONDS = int(os.environ.get('RATE_LIMIT_IP_SECONDS', 60))
+    RATE_LIMIT_IDENTITY_REQUESTS = int(
+        os.environ.get('RATE_LIMIT_IDENTITY_REQUESTS', 10))
+    RATE_LIMIT_IDENTITY_SECONDS = int(
+        os.environ.get('RATE_LIMIT_IDENTITY_SECONDS', 300))
+    # sentences
+    PASSWORD_CANDIDATES_MAX = int(os.environ.get('PASSWORD_CANDIDATES_MAX', 50))
+    # export
+    EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', 1000))
+    # question catalog
+    QUESTION_CATALOG_CACHE = os.environ.get(
+        'QUESTION_CATALOG_CACHE', 'true').lower() == 'true'
+    QUESTION_CATALOG_TTL = int(os.environ.get('QUESTION_CATALOG_TTL', 5))
+    # password reminders
+    REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 100))
+    REMINDER_POLL_SECONDS = int(os.environ.get('REMINDER_POLL_SECONDS', 60))
     # mail
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     DOMAIN_NAME = os.environ.get('DOMAIN_NAME')
     WEB_CLIENT_BASE_URL = os.environ.get('WEB_CLIENT_BASE_URL')
     MAIL_SERVER_API_KEY = os.environ.get('MAIL_SERVER_API_KEY')
+    MAIL_TIMEOUT_SECONDS = int(os.environ.get('MAIL_TIMEOUT_SECONDS', 10))
+    # email outbox
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_CONCURRENCY = int(os.environ.get('OUTBOX_CONCURRENCY', 4))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+    OUTBOX_BACKOFF_SECONDS = int(os.environ.get('OUTBOX_BACKOFF_SECONDS', 30))
+    OUTBOX_MAX_BACKOFF_SECONDS = int(
+        os.environ.get('OUTBOX_MAX_BACKOFF_SECONDS', 60 * 60))
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 5 * 60))
+    OUTBOX_POLL_SECONDS = int(os.environ.get('OUTBOX_POLL_SECONDS', 5))
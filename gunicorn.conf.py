@@ -0,0 +1,112 @@
+"""Gunicorn settings, loaded automatically by ``gunicorn app:app``.
+
+Three worker modes are supported through GUNICORN_WORKER_CLASS:
+
+* ``gthread`` (default): WEB_CONCURRENCY processes with GUNICORN_THREADS
+  threads each. The database driver waits on sockets, so threads overlap
+  slow requests for a fraction of the memory of extra processes.
+* ``sync``: one request at a time per process, the old behaviour.
+* ``gevent``: greenlets for I/O-bound traffic, requires ``pip install
+  gevent`` (and ``psycogreen`` on Postgres).
+
+In every mode password hashes run in each worker's hashing process pool
+(PASSWORD_HASH_WORKERS, the CPU count by default), so they neither hold a
+request thread's GIL nor block the event loop.
+
+The app is preloaded in the master and the heap is frozen before forking,
+so workers share its pages copy-on-write. Each worker then drops the
+database connections inherited from the master and warms its caches.
+"""
+import gc
+import os
+import shutil
+import tempfile
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+cpus = os.cpu_count() or 1
+
+if worker_class == 'gevent':
+    # Patch before the app and its drivers are preloaded.
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+if worker_class == 'sync':
+    default_workers = cpus * 2 + 1
+else:
+    default_workers = max(2, cpus)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) \
+    if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+
+# These are read by config.py when the app is preloaded. Every thread can
+# hold a connection.
+os.environ.setdefault('DATABASE_POOL_SIZE', str(threads))
+os.environ.setdefault('METRICS_DIR',
+                      os.path.join(tempfile.gettempdir(), 'cmp-metrics'))
+
+
+def on_starting(server):
+    # Metrics files of a previous master would be summed with ours.
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+
+
+def when_ready(server):
+    # Move the preloaded objects out of the collector's generations, so
+    # collections in the workers don't touch, and copy, the shared pages.
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    from api import db
+    from app import app
+
+    # Connections opened by the master must not be shared with the workers.
+    # close=False drops them from this worker's pool without closing them,
+    # closing would end the master's and the other workers' sessions too.
+    with app.app_context():
+        for bind in [None] + list(app.config['SQLALCHEMY_BINDS'] or {}):
+            db.get_engine(app, bind=bind).dispose(close=False)
+
+
+def post_worker_init(worker):
+    from api.catalog import catalog
+    from api.hashing import executor
+    from app import app
+
+    with app.app_context():
+        try:
+            catalog.snapshot()
+        except Exception as error:
+            app.logger.warning(f'Warm-up failed: {error}')
+        finally:
+            from api import db
+            db.session.remove()
+
+        pool = executor()
+        if pool is not None:
+            pool.submit(int).result()
+
+
+def worker_exit(server, worker):
+    from api.metrics import metrics
+    from app import app
+
+    with app.app_context():
+        metrics.flush(app.config['METRICS_DIR'])
@@ -74,6 +74,11 @@ def run_migrations_online():
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Index builds and constraint validation can outlast the
+            # statement_timeout the app sets on its connections.
+            connection.exec_driver_sql('SET statement_timeout = 0')
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
@@ -0,0 +1,31 @@
+"""user change
+
+Revision ID: 2e634cff3b30
+Revises: f1a9c6d2b470
+Create Date: 2026-10-18 16:42:07.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e634cff3b30'
+down_revision = 'f1a9c6d2b470'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('userId', sa.Integer(), nullable=False),
+    sa.Column('created_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_change_created_on'), 'user_change', ['created_on'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_change_created_on'), table_name='user_change')
+    op.drop_table('user_change')
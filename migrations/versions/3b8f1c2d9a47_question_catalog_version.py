@@ -0,0 +1,29 @@
+"""question catalog version
+
+Revision ID: 3b8f1c2d9a47
+Revises: e697f7df01cd
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f1c2d9a47'
+down_revision = 'e697f7df01cd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_version = op.create_table('catalog_version',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(catalog_version, [{'name': 'question', 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
@@ -0,0 +1,73 @@
+"""index answer and sentence foreign keys
+
+Fixes answer.questionId, which referenced user.id instead of question.id,
+and indexes the foreign keys used to look up a user's answers and
+sentences. On Postgres the indexes are built concurrently and the foreign
+key is validated separately, so neither blocks writes to the tables.
+
+Revision ID: 5f0b93d7e1a2
+Revises: c41a7e05b2d6
+Create Date: 2026-10-18 13:02:44.160573
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0b93d7e1a2'
+down_revision = 'c41a7e05b2d6'
+branch_labels = None
+depends_on = None
+
+naming_convention = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'
+}
+
+
+def is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if is_postgresql():
+        op.drop_constraint('answer_questionId_fkey', 'answer', type_='foreignkey')
+        op.create_foreign_key('answer_questionId_fkey', 'answer', 'question',
+                              ['questionId'], ['id'], postgresql_not_valid=True)
+
+        with op.get_context().autocommit_block():
+            op.execute('ALTER TABLE answer VALIDATE CONSTRAINT "answer_questionId_fkey"')
+            op.create_index('ix_answer_userId_questionId', 'answer', ['userId', 'questionId'],
+                            unique=True, postgresql_concurrently=True)
+            op.create_index(op.f('ix_sentence_userId'), 'sentence', ['userId'],
+                            unique=False, postgresql_concurrently=True)
+        return
+
+    with op.batch_alter_table('answer', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_answer_questionId_user', type_='foreignkey')
+        batch_op.create_foreign_key('fk_answer_questionId_question', 'question',
+                                    ['questionId'], ['id'])
+        batch_op.create_index('ix_answer_userId_questionId', ['userId', 'questionId'],
+                              unique=True)
+    op.create_index(op.f('ix_sentence_userId'), 'sentence', ['userId'], unique=False)
+
+
+def downgrade():
+    if is_postgresql():
+        with op.get_context().autocommit_block():
+            op.drop_index(op.f('ix_sentence_userId'), table_name='sentence',
+                          postgresql_concurrently=True)
+            op.drop_index('ix_answer_userId_questionId', table_name='answer',
+                          postgresql_concurrently=True)
+
+        op.drop_constraint('answer_questionId_fkey', 'answer', type_='foreignkey')
+        op.create_foreign_key('answer_questionId_fkey', 'answer', 'user',
+                              ['questionId'], ['id'])
+        return
+
+    op.drop_index(op.f('ix_sentence_userId'), table_name='sentence')
+    with op.batch_alter_table('answer', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_index('ix_answer_userId_questionId')
+        batch_op.drop_constraint('fk_answer_questionId_question', type_='foreignkey')
+        batch_op.create_foreign_key('fk_answer_questionId_user', 'user',
+                                    ['questionId'], ['id'])
@@ -0,0 +1,28 @@
+"""rate limit
+
+Revision ID: 7a4c2e9b8d13
+Revises: 5f0b93d7e1a2
+Create Date: 2026-10-18 11:52:08.614027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4c2e9b8d13'
+down_revision = '5f0b93d7e1a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit',
+    sa.Column('key', sa.String(length=128), nullable=False),
+    sa.Column('tat', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit')
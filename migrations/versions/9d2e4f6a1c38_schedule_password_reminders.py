@@ -0,0 +1,45 @@
+"""schedule password reminders
+
+Revision ID: 9d2e4f6a1c38
+Revises: 3b8f1c2d9a47
+Create Date: 2026-10-18 10:04:52.817340
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2e4f6a1c38'
+down_revision = '3b8f1c2d9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('next_reminder_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_user_next_reminder_at'), 'user', ['next_reminder_at'], unique=False)
+
+    user = sa.table('user',
+        sa.column('id', sa.Integer),
+        sa.column('password_reminder', sa.Integer),
+        sa.column('next_reminder_at', sa.DateTime))
+    connection = op.get_bind()
+    now = datetime.utcnow()
+    rows = connection.execute(
+        sa.select(user.c.id, user.c.password_reminder)
+        .where(user.c.password_reminder > 0)).fetchall()
+    if rows:
+        connection.execute(
+            user.update()
+            .where(user.c.id == sa.bindparam('user_id'))
+            .values(next_reminder_at=sa.bindparam('due')),
+            [{'user_id': row.id, 'due': now + timedelta(days=row.password_reminder)}
+             for row in rows])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_next_reminder_at'), table_name='user')
+    op.drop_column('user', 'next_reminder_at')
@@ -0,0 +1,35 @@
+"""revoked token
+
+Revision ID: b6e1d4f0a925
+Revises: 7a4c2e9b8d13
+Create Date: 2026-10-18 12:04:51.238914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1d4f0a925'
+down_revision = '7a4c2e9b8d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_token',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=32), nullable=True),
+    sa.Column('userId', sa.Integer(), nullable=True),
+    sa.Column('issued_before', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_on', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['userId'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_revoked_token_expires_at'), 'revoked_token', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_revoked_token_expires_at'), table_name='revoked_token')
+    op.drop_table('revoked_token')
@@ -0,0 +1,24 @@
+"""user version
+
+Revision ID: d83f5a2c7e61
+Revises: b6e1d4f0a925
+Create Date: 2026-10-18 13:21:07.514082
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd83f5a2c7e61'
+down_revision = 'b6e1d4f0a925'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('user', 'version')
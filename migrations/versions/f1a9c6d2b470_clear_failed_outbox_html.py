@@ -0,0 +1,30 @@
+"""clear failed outbox html
+
+Revision ID: f1a9c6d2b470
+Revises: d83f5a2c7e61
+Create Date: 2026-10-18 14:02:33.105927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a9c6d2b470'
+down_revision = 'd83f5a2c7e61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Failed emails kept their html, and with it the password token.
+    outbox_email = sa.table('outbox_email',
+        sa.column('status', sa.String),
+        sa.column('html', sa.Text))
+    op.execute(outbox_email.update()
+               .where(outbox_email.c.status == 'failed')
+               .values(html=''))
+
+
+def downgrade():
+    pass
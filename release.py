@@ -0,0 +1,102 @@
+"""Release step: migrate the database to head and seed it.
+
+    python release.py
+
+When the database is already at the newest Alembic revision and has its
+questions, this exits without importing the app, Flask or SQLAlchemy: the
+check is one query through the bare database driver. Otherwise it runs
+``flask db upgrade`` and seeds the missing questions. Safe to run on every
+deploy, and more than once.
+"""
+import os
+import re
+import sys
+
+from config import Config
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+versions_dir = os.path.join(basedir, 'migrations', 'versions')
+
+revision_pattern = re.compile(r"^revision = ['\"](\w+)['\"]", re.M)
+down_revision_pattern = re.compile(r"^down_revision = (.+)$", re.M)
+
+
+def head_revisions():
+    """
+    Find the head revisions by reading the migration scripts, which is much
+    faster than importing Alembic
+
+    :return set: The revisions no other revision revises
+    """
+    revisions, revised = set(), set()
+
+    for name in os.listdir(versions_dir):
+        if not name.endswith('.py'):
+            continue
+        with open(os.path.join(versions_dir, name)) as file:
+            source = file.read()
+
+        revision = revision_pattern.search(source)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = down_revision_pattern.search(source)
+        if down_revision:
+            revised.update(re.findall(r"['\"](\w+)['\"]", down_revision.group(1)))
+    return revisions - revised
+
+
+def connect(url):
+    """Open a DB-API connection to a SQLAlchemy database URL"""
+    if url.startswith('sqlite'):
+        import sqlite3
+
+        path = url.split('://', 1)[1][1:] or ':memory:'
+        return sqlite3.connect(path)
+
+    import psycopg2
+
+    return psycopg2.connect(re.sub(r'^[\w+]+://', 'postgresql://', url))
+
+
+def is_ready(url):
+    """
+    Whether the database is at the head revisions and has questions
+
+    :return bool: False if it isn't or the check failed
+    """
+    try:
+        connection = connect(url)
+    except Exception:
+        return False
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT version_num FROM alembic_version')
+        current = {row[0] for row in cursor.fetchall()}
+        cursor.execute('SELECT 1 FROM question LIMIT 1')
+        has_questions = cursor.fetchone() is not None
+    except Exception:
+        return False
+    finally:
+        connection.close()
+    return current == head_revisions() and has_questions
+
+
+def release():
+    from flask_migrate import upgrade
+
+    from api import create_app
+    from api.seed import seed_questions
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+        print(f'Added {seed_questions()} questions')
+
+
+if __name__ == '__main__':
+    if is_ready(Config.SQLALCHEMY_DATABASE_URI):
+        print('Database is up to date')
+        sys.exit(0)
+    release()
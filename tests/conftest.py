@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.security import generate_password_hash
+
+from api import create_app, db
+from api.seed import seed_questions
+from config import Config, engine_options
+
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog",
+    "Every good boy deserves fruit and some more",
+    "Curiosity killed the cat but satisfaction brought it back"
+]
+PASSWORD = 'password'
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Build an app backed by a fresh SQLite file, with its tables created and
+    the questions seeded
+
+    :return callable: Takes config values as keyword arguments
+    """
+    def make_app(**options):
+        uri = 'sqlite:///' + str(tmp_path / 'app.db')
+        options.setdefault('SQLALCHEMY_DATABASE_URI', uri)
+        options.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+        options.setdefault('SQLALCHEMY_BINDS', None)
+        options.setdefault('TESTING', True)
+        options.setdefault('PASSWORD_HASH_WORK_FACTOR', 1)
+        options.setdefault('PASSWORD_HASH_WORKERS', 0)
+        options.setdefault('PASSWORD_HASH_CONCURRENCY', 0)
+        options.setdefault('RATE_LIMIT_ENABLED', False)
+        options.setdefault('METRICS_DIR', None)
+        options.setdefault('MAIL_SERVER', 'http://mail.test/messages')
+        options.setdefault('WEB_CLIENT_BASE_URL', 'http://localhost:3000')
+        options.setdefault('DOMAIN_NAME', 'example')
+
+        app = create_app(type('TestConfig', (Config,), options))
+        with app.app_context():
+            db.create_all()
+            seed_questions()
+        return app
+    return make_app
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user_id(app):
+    """The id of a user whose answer to question ``q`` is ``'answer q'``,
+    with the three SENTENCES and PASSWORD"""
+    from api.models import Answer, Question, Sentence, User
+
+    with app.app_context():
+        user = User(username='user_0', email='user_0@example.com',
+                    password=generate_password_hash(PASSWORD,
+                                                    'pbkdf2:sha256:1'),
+                    password_reminder=7)
+        user.answers = [Answer(text=f'answer {question.id}',
+                               questionId=question.id)
+                        for question in Question.query.all()]
+        user.sentences = [Sentence(text=text) for text in SENTENCES]
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements every engine executes during the test, clear it
+    before the request to count"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', before_execute)
+    yield statements
+    event.remove(Engine, 'before_cursor_execute', before_execute)
@@ -0,0 +1,45 @@
+from api.models import User
+
+
+def auth(app, user_id):
+    with app.app_context():
+        token = User.query.get(user_id).encode_auth_token()
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_admin_is_authorized_against_the_database(make_app, user_id):
+    # Two workers sharing a database, each with its own identity cache.
+    worker = make_app(ADMIN_EMAILS=['user_0@example.com'])
+    other = make_app()
+    headers = auth(worker, user_id)
+
+    client = worker.test_client()
+    assert client.get('/api/users/export?table=sentence',
+                      headers=headers).status_code == 200
+
+    with other.app_context():
+        user = User.query.get(user_id)
+        user.email = 'demoted@example.com'
+        user.save()
+
+    # The worker still caches the admin email.
+    with worker.app_context():
+        assert worker.extensions['user_cache'].get(user_id)['email'] == \
+            'user_0@example.com'
+    assert client.get('/api/users/export?table=sentence',
+                      headers=headers).status_code == 403
+
+
+def test_stale_admin_email_does_not_grant_access(make_app, user_id):
+    worker = make_app(ADMIN_EMAILS=['admin@example.com'])
+    headers = auth(worker, user_id)
+    client = worker.test_client()
+
+    # The cache holds an admin email the user no longer has.
+    assert client.get('/api/users', headers=headers).status_code == 200
+    with worker.app_context():
+        cache = worker.extensions['user_cache']
+        cache.set(user_id, dict(cache.get(user_id), email='admin@example.com'))
+
+    assert client.get('/api/users/export?table=sentence',
+                      headers=headers).status_code == 403
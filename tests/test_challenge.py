@@ -0,0 +1,83 @@
+import pytest
+
+from api.models import User
+
+ANSWER = {'questionId': '1', 'answer': 'answer 1'}
+
+
+def answer_queries(statements):
+    """The statements that read a challenge question or answer"""
+    return [statement for statement in statements
+            if 'JOIN answer' in statement or 'FROM answer' in statement or
+            'FROM question' in statement]
+
+
+def assert_verified_once(statements):
+    queries = answer_queries(statements)
+    assert len(queries) == 1, queries
+    # The user, the question and the answer come from the same query.
+    assert 'FROM user LEFT OUTER JOIN question' in queries[0]
+
+
+@pytest.fixture
+def token(app, user_id):
+    with app.app_context():
+        return User.query.get(user_id).encode_auth_token()
+
+
+@pytest.fixture
+def reset_token(app, user_id):
+    with app.app_context():
+        return User.query.get(user_id).encode_auth_token(
+            password='secret', reset_password=True)
+
+
+@pytest.mark.parametrize('answer, status', [('answer 1', 200),
+                                            ('wrong', 401)])
+def test_login(client, user_id, statements, answer, status):
+    statements.clear()
+    response = client.post('/api/users/login', json={
+        'userId': str(user_id), 'questionId': '1', 'answer': answer})
+
+    assert response.status_code == status
+    assert_verified_once(statements)
+
+
+def test_forgot_password(client, user_id, statements):
+    statements.clear()
+    response = client.post('/api/users/forgot-password',
+                           json=dict(ANSWER, email='user_0@example.com'))
+
+    assert response.status_code == 200
+    assert_verified_once(statements)
+
+
+def test_get_password(client, reset_token, statements):
+    statements.clear()
+    response = client.post('/api/users/get-password',
+                           json=dict(ANSWER, token=reset_token))
+
+    assert response.status_code == 200
+    assert response.get_json() == {'password': 'secret'}
+    assert_verified_once(statements)
+
+
+def test_change_email(client, token, statements):
+    statements.clear()
+    response = client.put('/api/users', json=dict(
+        ANSWER, email='changed@example.com'),
+        headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    assert response.get_json()['email'] == 'changed@example.com'
+    assert_verified_once(statements)
+
+
+def test_unknown_question(client, user_id, statements):
+    statements.clear()
+    response = client.post('/api/users/login', json={
+        'userId': str(user_id), 'questionId': '99', 'answer': 'answer 1'})
+
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'That question does not exist.'
+    assert_verified_once(statements)
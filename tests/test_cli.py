@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from api import cli
+
+
+@pytest.fixture
+def runner(app):
+    cli.register(app)
+    return app.test_cli_runner()
+
+
+def test_commands_import_their_modules_when_they_run():
+    code = 'import json, sys, api.cli; print(json.dumps(list(sys.modules)))'
+    modules = json.loads(subprocess.check_output([sys.executable, '-c', code]))
+
+    assert 'api.export' not in modules
+    assert 'api.importer' not in modules
+
+
+def test_export(runner, user_id):
+    result = runner.invoke(args=['users', 'export', '--table', 'answer'])
+
+    assert result.exit_code == 0, result.output
+    rows = [json.loads(line) for line in result.output.splitlines()]
+    assert {row['table'] for row in rows} == {'answer'}
+    assert len(rows) == 2
+
+
+def test_export_page_size_defaults_to_the_config(make_app, user_id,
+                                                 statements):
+    app = make_app(EXPORT_PAGE_SIZE=1)
+    cli.register(app)
+
+    statements.clear()
+    result = app.test_cli_runner().invoke(
+        args=['users', 'export', '--table', 'answer'])
+
+    assert result.exit_code == 0, result.output
+    # A page per answer, and the empty page that ends the table.
+    assert len([statement for statement in statements
+                if 'FROM answer' in statement]) == 3
+
+
+def test_export_rejects_unknown_tables(runner):
+    result = runner.invoke(args=['users', 'export', '--table', 'password'])
+
+    assert result.exit_code == 2
+    assert 'must be one of user, answer, sentence' in result.output
@@ -0,0 +1,50 @@
+import pytest
+
+from api import hashing
+from api.models import User
+
+
+@pytest.mark.parametrize('name, prefix', [('pbkdf2', 'pbkdf2:sha256:1024$'),
+                                          ('scrypt', 'scrypt:1024:8:1$')])
+def test_hashers(make_app, name, prefix):
+    app = make_app(PASSWORD_HASHER=name, PASSWORD_HASH_WORK_FACTOR=1024)
+
+    with app.app_context():
+        hasher = hashing.get_hasher()
+        password_hash = hasher.hash('secret')
+
+        assert password_hash.startswith(prefix)
+        assert hasher.verify(password_hash, 'secret')
+        assert not hasher.verify(password_hash, 'wrong')
+        assert not hasher.needs_rehash(password_hash)
+
+
+def test_work_factor(make_app):
+    app = make_app(PASSWORD_HASHER='scrypt', PASSWORD_HASH_WORK_FACTOR=0)
+
+    with app.app_context():
+        # 0 is the hasher's default, scrypt's N is a power of 2.
+        assert hashing.get_hasher().method == 'scrypt:32768:8:1'
+        assert hashing.get_hasher(3000).method == 'scrypt:2048:8:1'
+
+
+def test_login_upgrades_the_hash_to_the_configured_hasher(make_app, user_id):
+    app = make_app(PASSWORD_HASHER='scrypt', PASSWORD_HASH_WORK_FACTOR=1024)
+
+    with app.app_context():
+        user = User.query.get(user_id)
+        assert user.password.startswith('pbkdf2:')
+
+        assert user.check_password('password')
+        assert User.query.get(user_id).password.startswith('scrypt:1024:8:1$')
+        assert user.check_password('password')
+
+
+def test_hashes_run_in_the_pool(make_app):
+    app = make_app(PASSWORD_HASHER='scrypt', PASSWORD_HASH_WORK_FACTOR=1024,
+                   PASSWORD_HASH_WORKERS=1)
+
+    with app.app_context():
+        hasher = hashing.get_hasher()
+        assert hashing.executor() is not None
+        assert hasher.verify(hasher.hash('secret'), 'secret')
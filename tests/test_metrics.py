@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+from time import sleep
+
+from api.metrics import metrics
+
+
+def ping_count(text):
+    for line in text.splitlines():
+        if line.startswith('cmp_http_requests_total{endpoint="ping"'):
+            return int(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_metrics_are_forbidden_without_a_token(client):
+    assert client.get('/api/metrics').status_code == 403
+
+
+def test_metrics_token(make_app):
+    client = make_app(METRICS_TOKEN='secret').test_client()
+
+    assert client.get('/api/metrics').status_code == 401
+    response = client.get('/api/metrics',
+                          headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+
+def test_public_metrics(make_app):
+    client = make_app(METRICS_PUBLIC=True).test_client()
+
+    client.get('/api/ping')
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert ping_count(response.get_data(as_text=True)) >= 1
+
+
+def test_idle_worker_flushes_its_last_requests(make_app, tmp_path):
+    directory = str(tmp_path / 'metrics')
+    client = make_app(METRICS_DIR=directory,
+                      METRICS_FLUSH_SECONDS=1).test_client()
+
+    for _ in range(3):
+        client.get('/api/ping')
+    expected = metrics.registry.to_dict()['requests']
+
+    # No request comes after the last ping, the flush thread writes them.
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    for _ in range(50):
+        if os.path.exists(path):
+            with open(path) as file:
+                if json.load(file)['requests'] == expected:
+                    break
+        sleep(0.1)
+    else:
+        raise AssertionError('The metrics were not flushed')
+
+
+def test_flush_without_an_app_context(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING, logger='api.metrics'):
+        metrics.flush(str(tmp_path / 'missing'))
+
+    assert 'Could not write metrics' in caplog.text
@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from api import db, outbox
+from api.models import OutboxEmail
+
+
+class StubSession(object):
+    """Stands in for the mail server's HTTP session. Each post is answered
+    with the next of ``statuses``, None raises a connection error."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append(kwargs['data'])
+        status = self.statuses.pop(0)
+        if status is None:
+            raise requests.ConnectionError('Connection refused')
+
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        return response
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+@pytest.fixture
+def email_id(app):
+    with app.app_context():
+        email = OutboxEmail(recipient='user_0@example.com',
+                            subject='Password', html='<p>secret</p>')
+        db.session.add(email)
+        db.session.commit()
+        return email.id
+
+
+def make_due(email_id):
+    OutboxEmail.query.filter_by(id=email_id).update(
+        {'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+
+def test_sent_email_clears_html(app, executor, email_id):
+    session = StubSession(200)
+
+    with app.app_context():
+        assert outbox.dispatch(session, executor) == (1, 0)
+        email = OutboxEmail.query.get(email_id)
+
+        assert email.status == OutboxEmail.SENT
+        assert email.sent_on is not None
+        assert email.html == ''
+    assert session.posts[0]['html'] == '<p>secret</p>'
+
+
+def test_failed_attempt_is_retried_after_a_backoff(app, executor, email_id):
+    session = StubSession(None, 200)
+
+    with app.app_context():
+        start = datetime.utcnow()
+        assert outbox.dispatch(session, executor) == (0, 1)
+        email = OutboxEmail.query.get(email_id)
+
+        assert email.status == OutboxEmail.PENDING
+        assert email.attempts == 1
+        assert 'Connection refused' in email.last_error
+        assert email.html == '<p>secret</p>'
+        # Full jitter over the first delay, OUTBOX_BACKOFF_SECONDS.
+        delay = app.config['OUTBOX_BACKOFF_SECONDS']
+        assert start + timedelta(seconds=delay / 2) <= email.next_attempt_at
+        assert email.next_attempt_at <= \
+            datetime.utcnow() + timedelta(seconds=delay)
+
+        # Not due yet.
+        assert outbox.dispatch(session, executor) == (0, 0)
+
+        make_due(email_id)
+        assert outbox.dispatch(session, executor) == (1, 0)
+        email = OutboxEmail.query.get(email_id)
+
+        assert email.status == OutboxEmail.SENT
+        assert email.attempts == 2
+        assert email.last_error is None
+        assert email.html == ''
+    assert len(session.posts) == 2
+
+
+def test_email_fails_for_good_after_max_attempts(make_app, executor):
+    app = make_app(OUTBOX_MAX_ATTEMPTS=2)
+    session = StubSession(500, 503)
+
+    with app.app_context():
+        email = OutboxEmail(recipient='user_0@example.com',
+                            subject='Password', html='<p>secret</p>')
+        db.session.add(email)
+        db.session.commit()
+        email_id = email.id
+
+        assert outbox.dispatch(session, executor) == (0, 1)
+        make_due(email_id)
+        assert outbox.dispatch(session, executor) == (0, 1)
+        email = OutboxEmail.query.get(email_id)
+
+        assert email.status == OutboxEmail.FAILED
+        assert email.attempts == 2
+        assert '503' in email.last_error
+        assert email.html == ''
+
+        # A failed email is not picked up again.
+        make_due(email_id)
+        assert outbox.dispatch(session, executor) == (0, 0)
+    assert len(session.posts) == 2
@@ -0,0 +1,104 @@
+"""SQL statements per request against a budget per endpoint.
+
+Every case runs against a fresh app, so its caches are cold and the request
+runs its worst case. An N+1 query shows up as a count that grows with the
+seeded rows: the user has an answer per question and three sentences.
+"""
+import pytest
+
+from api.models import User
+from tests.conftest import PASSWORD, SENTENCES
+
+ANSWER = {'questionId': '1', 'answer': 'answer 1'}
+SIGNUP = {
+    'username': 'new_user', 'email': 'new_user@example.com',
+    'password': 'Secret#123', 'password_reminder': 7,
+    'answers': [{'text': 'answer 1', 'questionId': '1'},
+                {'text': 'answer 2', 'questionId': '2'}],
+    'sentences': [{'text': sentence} for sentence in SENTENCES]}
+
+# Raise a budget only with the statement that justifies it. Shared parts:
+#   catalog: a cold question catalog reads its version, then the questions.
+#   auth: a token's first check reads the revoked_token rows, then the
+#     user_change rows, then loads the user into the identity cache.
+#   challenge: verify_answer reads the user, the question and the answer in
+#     one query.
+#   saved user: user_change insert, its prune and the update.
+BUDGETS = [
+    # catalog, the questions are sent with the passwords; the sentences are
+    # analysed in memory.
+    ('sentences.validate_sentence', 'POST', '/api/sentences/validate',
+     {'json': SENTENCES}, 2),
+    # Analysed in memory.
+    ('sentences.get_passwords', 'POST', '/api/sentences/passwords',
+     {'json': SENTENCES}, 0),
+    # catalog for the answers' questionIds, one query for a taken username
+    # or email.
+    ('users.validate_user', 'POST', '/api/users/validate',
+     {'json': SIGNUP}, 3),
+    # validate_user's 3, the user, one insert per answer and per sentence,
+    # as SQLite has no RETURNING batch, and the welcome email.
+    ('users.create_user', 'POST', '/api/users', {'json': SIGNUP}, 10),
+    # The user by username or email, then catalog for the question to ask.
+    ('users.validate_login', 'POST', '/api/users/validate-login',
+     {'json': {'identity': 'user_0', 'password': PASSWORD}}, 3),
+    # challenge.
+    ('users.login', 'POST', '/api/users/login',
+     {'json': dict(ANSWER, userId='{user_id}')}, 1),
+    # The user by email, then catalog.
+    ('users.validate_user_email', 'POST', '/api/users/validate-user',
+     {'json': {'email': 'user_0@example.com'}}, 3),
+    # catalog.
+    ('users.get_question', 'GET', '/api/users/question', {}, 2),
+    # revoked_token for the reset token, then challenge.
+    ('users.view_password', 'POST', '/api/users/get-password',
+     {'json': dict(ANSWER, token='{reset_token}')}, 2),
+    # auth, the email's owner, catalog.
+    ('users.validate_email', 'POST', '/api/users/validate-email',
+     {'json': {'email': 'other@example.com'}, 'headers': 'auth'}, 6),
+    # auth, the ETag comes from the cached user.
+    ('users.get_user', 'GET', '/api/users', {'headers': 'auth'}, 3),
+    # auth, the email's owner, challenge, saved user, and the user reloaded
+    # after the commit for the response.
+    ('users.change_email', 'PUT', '/api/users',
+     {'json': dict(ANSWER, email='changed@example.com'),
+      'headers': 'auth'}, 9),
+    # auth, the expired revoked_token rows pruned, the token revoked.
+    ('users.logout_user', 'GET', '/api/users/logout', {'headers': 'auth'}, 5),
+    # challenge, the sentences for the new password, saved user, the expired
+    # revoked_token rows pruned, the email and the user's tokens revoked.
+    ('users.forgot_password', 'POST', '/api/users/forgot-password',
+     {'json': dict(ANSWER, email='user_0@example.com')}, 8),
+]
+
+
+def fill(value, values):
+    """Replace the ``{name}`` placeholders in the request's strings"""
+    if isinstance(value, dict):
+        return {key: fill(item, values) for key, item in value.items()}
+    if isinstance(value, str):
+        return value.format(**values)
+    return value
+
+
+@pytest.mark.parametrize('endpoint, method, path, kwargs, budget', BUDGETS,
+                         ids=[case[0] for case in BUDGETS])
+def test_query_budget(app, client, user_id, statements,
+                      endpoint, method, path, kwargs, budget):
+    with app.app_context():
+        user = User.query.get(user_id)
+        values = {'user_id': user_id,
+                  'reset_token': user.encode_auth_token(
+                      password='secret', reset_password=True)}
+        token = user.encode_auth_token()
+    kwargs = fill(kwargs, values)
+    if kwargs.get('headers') == 'auth':
+        kwargs['headers'] = {'Authorization': f'Bearer {token}'}
+
+    statements.clear()
+    response = client.open(path, method=method, **kwargs)
+
+    assert response.status_code < 400, response.get_json()
+    assert app.url_map.bind('localhost').match(path, method)[0] == endpoint
+    assert len(statements) <= budget, statements
+
@@ -0,0 +1,72 @@
+import pytest
+from flask import g
+from sqlalchemy import inspect
+
+from api import db
+from api.models import Question
+from api.replica import primary, read_replica
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(SQLALCHEMY_BINDS={
+        'replica': 'sqlite:///' + str(tmp_path / 'replica.db')})
+
+
+def engines(app):
+    return db.get_engine(app), db.get_engine(app, bind='replica')
+
+
+def bind():
+    return db.session.get_bind(Question.__mapper__)
+
+
+def test_reads_go_to_the_primary_by_default(app):
+    primary_engine, _ = engines(app)
+
+    with app.test_request_context():
+        assert bind() is primary_engine
+
+
+def test_read_replica_views_read_from_the_replica(app):
+    primary_engine, replica_engine = engines(app)
+
+    @read_replica
+    def view():
+        assert bind() is replica_engine
+        with primary():
+            assert bind() is primary_engine
+        assert bind() is replica_engine
+        return 'done'
+
+    with app.test_request_context():
+        assert view() == 'done'
+        assert not g.db_replica
+        assert bind() is primary_engine
+
+
+def test_flushes_go_to_the_primary(app):
+    _, replica_engine = engines(app)
+    # The replica has no tables, a write sent there would fail.
+    assert not inspect(replica_engine).has_table('question')
+
+    @read_replica
+    def view():
+        db.session.add(Question(text='Written in a replica view'))
+        db.session.commit()
+
+    with app.test_request_context():
+        view()
+        assert Question.query.filter_by(
+            text='Written in a replica view').count() == 1
+
+
+def test_without_a_replica_reads_go_to_the_primary(make_app):
+    app = make_app()
+
+    @read_replica
+    def view():
+        return bind()
+
+    with app.test_request_context():
+        assert view() is db.get_engine(app)
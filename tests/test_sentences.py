@@ -0,0 +1,33 @@
+from api.utils import analyze_sentences
+
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog",
+    "Every good boy deserves fruit and some more",
+    "Curiosity killed the cat but satisfaction brought it back"
+]
+
+
+def test_analysis_is_cached(app):
+    with app.test_request_context():
+        assert analyze_sentences(list(SENTENCES)) is \
+            analyze_sentences(list(SENTENCES))
+
+
+def test_sentences_that_join_alike_have_their_own_analysis(app):
+    first = ['one two three four five\0six', 'seven eight nine ten eleven',
+             SENTENCES[2]]
+    second = ['one two three four five', 'six\0seven eight nine ten eleven',
+              SENTENCES[2]]
+
+    with app.test_request_context():
+        assert analyze_sentences(first).word_counts == (6, 5, 9)
+        assert analyze_sentences(second).word_counts == (5, 6, 9)
+
+
+def test_validate_then_passwords(client):
+    assert client.post('/api/sentences/validate',
+                       json=SENTENCES).status_code == 200
+    response = client.post('/api/sentences/passwords?count=5', json=SENTENCES)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['passwords']) == 5
@@ -0,0 +1,38 @@
+import pytest
+
+from api.models import User
+
+SIGNUP = {
+    'username': 'new_user', 'email': 'new_user@example.com',
+    'password': 'Secret#123', 'password_reminder': 7,
+    'sentences': [{'text': 'The quick brown fox jumps over the lazy dog'}]}
+
+
+def signup(**fields):
+    return dict(SIGNUP, **fields)
+
+
+def test_signup(app, client):
+    response = client.post('/api/users', json=signup(answers=[
+        {'text': 'answer 1', 'questionId': '1'},
+        {'text': 'answer 2', 'questionId': '2'}]))
+
+    assert response.status_code == 201
+    with app.app_context():
+        assert User.find_by_username('new_user') is not None
+
+
+@pytest.mark.parametrize('answers, message', [
+    ([{'text': 'a', 'questionId': '1'}, {'text': 'b', 'questionId': '1'}],
+     'Answer each question only once.'),
+    ([{'text': 'a', 'questionId': '1'}, {'text': 'b', 'questionId': '99'}],
+     'Question 99 does not exist.'),
+])
+def test_invalid_answers_are_rejected(app, client, answers, message):
+    for path in ('/api/users/validate', '/api/users'):
+        response = client.post(path, json=signup(answers=answers))
+
+        assert response.status_code == 422
+        assert message in response.get_json()['message']['answers']
+    with app.app_context():
+        assert User.find_by_username('new_user') is None
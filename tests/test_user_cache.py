@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+from api import db
+from api.models import User, UserChange
+
+
+def auth(app, user_id):
+    with app.app_context():
+        token = User.query.get(user_id).encode_auth_token()
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_change_by_another_worker_evicts_the_user(make_app, user_id):
+    # Two workers sharing a database, each with its own identity cache.
+    worker = make_app(USER_CACHE_REFRESH_SECONDS=0)
+    other = make_app()
+    headers = auth(worker, user_id)
+    client = worker.test_client()
+
+    response = client.get('/api/users', headers=headers)
+    etag = response.headers['ETag']
+    assert response.get_json()['email'] == 'user_0@example.com'
+
+    with other.app_context():
+        user = User.query.get(user_id)
+        user.email = 'changed@example.com'
+        user.save()
+
+    response = client.get('/api/users', headers=dict(
+        headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['email'] == 'changed@example.com'
+
+
+def test_unchanged_profile_is_revalidated_without_a_query(client, app,
+                                                          user_id, statements):
+    headers = auth(app, user_id)
+    etag = client.get('/api/users', headers=headers).headers['ETag']
+
+    statements.clear()
+    response = client.get('/api/users', headers=dict(
+        headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert statements == []
+
+
+def test_expired_changes_are_pruned(app, user_id):
+    with app.app_context():
+        db.session.add(UserChange(
+            userId=user_id,
+            created_on=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+
+        user = User.query.get(user_id)
+        user.password = 'changed'
+        user.save()
+
+        assert [change.userId for change in UserChange.query.all()] == \
+            [user_id]